@@ -17,18 +17,22 @@ setup(
     packages=find_packages(),
     classifiers=[
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.8",
-        "Programming Language :: Python :: 3.9",
         "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
         "Development Status :: 4 - Beta",
         "Intended Audience :: Developers",
         "Topic :: Internet :: WWW/HTTP :: Indexing/Search",
     ],
-    python_requires=">=3.8",
+    python_requires=">=3.10",
     install_requires=requirements,
     extras_require={
+        'speedups': [
+            'orjson>=3.8.0',
+            'aiodns>=3.0.0',
+            'uvloop>=0.17.0; sys_platform != "win32"',
+        ],
         'dev': [
             'pytest>=6.0',
             'pytest-asyncio>=0.16.0',
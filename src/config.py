@@ -1,8 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List, Optional
 from pathlib import Path
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CrawlerConfig:
     max_depth: int
     max_links: int
@@ -10,16 +10,24 @@ class CrawlerConfig:
     timeout: int
     output_path: Path
     exclusion_patterns: List[str]
-    exclude_keywords: List[str]  # Keywords to exclude from URLs
+    exclude_keywords: List[str] = field(default_factory=list)  # Keywords to exclude from URLs
     user_agent: str = "WebCrawlerExtractor/1.0"
     respect_robots_txt: bool = True
     same_path_only: bool = False
+    stream_pages: bool = False  # Write page content to an NDJSON file next to the output as pages arrive
+    deduplicate_content: bool = False  # Skip storing text that duplicates an earlier page
+    max_concurrency: int = 16  # Number of worker tasks crawling in parallel
+    per_host_concurrency: int = 8  # Open connections allowed to a single host
+    nameservers: Optional[List[str]] = None  # DNS servers for the async resolver (system default if None)
+    max_page_bytes: int = 2_000_000  # Pages larger than this are truncated
     # Retry mechanism parameters
     max_retries: int = 3
-    retry_delay: float = 1.0  # Base delay for exponential backoff
+    retry_delay: float = 1.0  # Minimum delay between retries
+    max_retry_delay: float = 30.0  # Upper bound for a single backoff delay
     # Circuit breaker pattern parameters
     circuit_breaker_threshold: int = 5  # Number of failures before circuit opens
     circuit_breaker_timeout: int = 300  # Time in seconds before circuit resets
+    circuit_breaker_window: float = 60.0  # Seconds within which threshold failures open the circuit
     
     @classmethod
     def default_config(cls):
@@ -1,17 +1,63 @@
-from bs4 import BeautifulSoup
-from typing import Dict, List, Optional
+from bs4 import BeautifulSoup, SoupStrainer
+from typing import Any, ClassVar, Dict, List, Optional, Tuple
+from html import unescape
 import re
 import logging
 
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # Fall back to BeautifulSoup with the lxml parser
+    LexborHTMLParser = None
+
+_HIDDEN_RE = re.compile(r'display:\s*none')
+_TAG_RE = re.compile(r'<[^>]*>')
+_PLACEHOLDER_RE = re.compile(r'\[CODE_BLOCK_(\d+)\]')
+_CLASS_ATTR_RE = re.compile(r'''\bclass\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))''', re.I)
+
+# Subtrees the BeautifulSoup fallback builds; the rest of <head> (scripts,
+# stylesheets, metadata) is skipped while the document is fed. A strainer only
+# decides which tags to keep, not what they contain, so it keeps the whole body
+# and leaves navigation chrome to _remove_unwanted_elements.
+_CONTENT_STRAINER = SoupStrainer(['title', 'body'])
+
+def _select(tree: Any, selector: str) -> List[Any]:
+    """Return all nodes matching a CSS selector on either parser backend."""
+    return tree.css(selector) if LexborHTMLParser else tree.select(selector)
+
+def _select_one(tree: Any, selector: str) -> Optional[Any]:
+    """Return the first node matching a CSS selector on either parser backend."""
+    return tree.css_first(selector) if LexborHTMLParser else tree.select_one(selector)
+
+def _node_text(node: Any) -> str:
+    """Return the text content of a node on either parser backend."""
+    return node.text() if LexborHTMLParser else node.get_text()
+
+def _node_attr(node: Any, name: str) -> str:
+    """Return an attribute value as a string on either parser backend."""
+    if LexborHTMLParser:
+        return node.attributes.get(name) or ''
+    value = node.get(name) or ''
+    return ' '.join(value) if isinstance(value, list) else value
+
 class ContentExtractor:
     """Handles the extraction and cleaning of web content."""
     
+    EXCLUDED_TAGS: ClassVar[frozenset] = frozenset({
+        'header', 'footer', 'nav', 'aside', 'script', 'style',
+        'noscript', 'iframe', 'ad', 'advertisement'
+    })
+    PRESERVED_TAGS: ClassVar[frozenset] = frozenset({'pre', 'code'})
+    # Comments and raw-text elements are matched too, so a code block is never
+    # looked for inside them; only the <pre>/<code> alternative is replaced
+    _CODE_BLOCK_RE: ClassVar[re.Pattern] = re.compile(
+        r'<!--.*?-->|<(?P<raw>script|style)\b[^>]*>.*?</(?P=raw)\s*>'
+        r'|<(?P<tag>%s)\b(?P<attrs>[^>]*)>(?P<body>.*?)</(?P=tag)\s*>' % '|'.join(sorted(PRESERVED_TAGS)),
+        re.S | re.I
+    )
+    # Matches every excluded tag, so one tree traversal removes them all
+    _EXCLUDED_SELECTOR: ClassVar[str] = ','.join(sorted(EXCLUDED_TAGS))
+    
     def __init__(self):
-        self.excluded_tags = {
-            'header', 'footer', 'nav', 'aside', 'script', 'style',
-            'noscript', 'iframe', 'ad', 'advertisement'
-        }
-        self.preserved_tags = {'pre', 'code'}
         self.logger = logging.getLogger(__name__)
 
     def extract_content(self, html: str, url: str) -> Dict:
@@ -26,19 +72,19 @@ class ContentExtractor:
             Dict containing extracted content and metadata
         """
         try:
-            soup = BeautifulSoup(html, 'html.parser')
+            # Store code blocks before parsing and cleaning
+            html, code_blocks = self._extract_code_blocks_regex(html)
             
-            # Store code blocks before cleaning
-            code_blocks = self._preserve_code_blocks(soup)
+            tree = self._parse(html)
             
             # Remove unwanted elements
-            self._remove_unwanted_elements(soup)
+            self._remove_unwanted_elements(tree)
             
             # Extract title
-            title = self._extract_title(soup)
+            title = self._extract_title(tree)
             
             # Extract main content
-            main_content = self._extract_main_content(soup)
+            main_content = self._extract_main_content(tree)
             
             # Reinsert code blocks
             final_content = self._reinsert_code_blocks(main_content, code_blocks)
@@ -59,58 +105,94 @@ class ContentExtractor:
                 'code_blocks': []
             }
 
-    def _preserve_code_blocks(self, soup: BeautifulSoup) -> List[str]:
-        """Extract and preserve code blocks."""
+    def _parse(self, html: str) -> Any:
+        """Parse HTML with selectolax when available, otherwise BeautifulSoup/lxml."""
+        if LexborHTMLParser:
+            return LexborHTMLParser(html)
+        return BeautifulSoup(html, 'lxml', parse_only=_CONTENT_STRAINER)
+
+    def _extract_code_blocks_regex(self, html: str) -> Tuple[str, List[Dict]]:
+        """
+        Extract code blocks from raw HTML and replace them with placeholders.
+        
+        Scanning the markup for <pre>/<code> elements is much cheaper than
+        building parser nodes for the whole page just to find them. Regular
+        expressions cannot parse HTML in general, so this relies on code blocks
+        being well formed: an unclosed <pre> is left in place and ends up as
+        plain text, and a nested block of the same tag name ends the match at
+        its first closing tag. Comments and <script>/<style> bodies are skipped
+        over, but other text that merely looks like a tag (attribute values,
+        <textarea> contents) is not, and an unclosed comment or script leaves
+        the rest of the page scanned as ordinary markup.
+        
+        Returns:
+            Tuple of the HTML with placeholders and the extracted code blocks
+        """
         code_blocks = []
-        for tag in soup.find_all(self.preserved_tags):
+        
+        def _replace(match: re.Match) -> str:
+            if match.group('tag') is None:
+                return match.group(0)  # A comment or script/style element, left as it is
+            class_match = _CLASS_ATTR_RE.search(match.group('attrs'))
+            classes = next((g for g in class_match.groups() if g is not None), '').split() if class_match else []
             code_blocks.append({
-                'content': tag.get_text(),
-                'language': tag.get('class', [''])[0] if tag.get('class') else ''
+                'content': unescape(_TAG_RE.sub('', match.group('body'))),
+                'language': classes[0] if classes else ''
             })
-            tag.replace_with(f'[CODE_BLOCK_{len(code_blocks)-1}]')
-        return code_blocks
+            return f'[CODE_BLOCK_{len(code_blocks)-1}]'
+        
+        return type(self)._CODE_BLOCK_RE.sub(_replace, html), code_blocks
 
-    def _remove_unwanted_elements(self, soup: BeautifulSoup) -> None:
+    def _remove_unwanted_elements(self, tree: Any) -> None:
         """Remove unwanted HTML elements."""
-        for tag in self.excluded_tags:
-            for element in soup.find_all(tag):
-                element.decompose()
+        if LexborHTMLParser:
+            unwanted = tree.css(type(self)._EXCLUDED_SELECTOR)
+        else:
+            unwanted = tree.find_all(type(self).EXCLUDED_TAGS)
+        for node in unwanted:
+            node.decompose()
         
         # Remove hidden elements
-        for element in soup.find_all(style=re.compile(r'display:\s*none')):
-            element.decompose()
+        for node in _select(tree, '[style]'):
+            if _HIDDEN_RE.search(_node_attr(node, 'style')):
+                node.decompose()
 
-    def _extract_title(self, soup: BeautifulSoup) -> str:
+    def _extract_title(self, tree: Any) -> str:
         """Extract page title."""
-        title_tag = soup.find('title')
-        if title_tag:
-            return title_tag.get_text().strip()
-        h1_tag = soup.find('h1')
-        if h1_tag:
-            return h1_tag.get_text().strip()
+        title_node = _select_one(tree, 'title')
+        if title_node:
+            return _node_text(title_node).strip()
+        h1_node = _select_one(tree, 'h1')
+        if h1_node:
+            return _node_text(h1_node).strip()
         return ''
 
-    def _extract_main_content(self, soup: BeautifulSoup) -> str:
+    def _extract_main_content(self, tree: Any) -> str:
         """Extract main content from the page."""
         # Try to find main content container
-        main_content = soup.find('main') or soup.find('article') or soup.find('div', class_=re.compile(r'content|main|article'))
+        main_content = (
+            _select_one(tree, 'main') or _select_one(tree, 'article') or
+            _select_one(tree, 'div[class*="content"], div[class*="main"], div[class*="article"]')
+        )
         
         if main_content:
-            return self._clean_text(main_content.get_text())
-        return self._clean_text(soup.get_text())
+            return self._clean_text(_node_text(main_content))
+        if LexborHTMLParser:
+            return self._clean_text(tree.root.text() if tree.root else '')
+        return self._clean_text(tree.get_text())
 
     def _reinsert_code_blocks(self, content: str, code_blocks: List[Dict]) -> str:
-        """Reinsert preserved code blocks into content."""
-        for i, block in enumerate(code_blocks):
-            placeholder = f'[CODE_BLOCK_{i}]'
-            replacement = f"\n```{block['language']}\n{block['content']}\n```\n"
-            content = content.replace(placeholder, replacement)
-        return content
+        """Reinsert preserved code blocks into content in a single pass."""
+        def _replace(match: re.Match) -> str:
+            index = int(match.group(1))
+            if index >= len(code_blocks):
+                return match.group(0)  # Literal text that only looks like a placeholder
+            block = code_blocks[index]
+            return f"\n```{block['language']}\n{block['content']}\n```\n"
+        
+        return _PLACEHOLDER_RE.sub(_replace, content)
 
     def _clean_text(self, text: str) -> str:
         """Clean extracted text."""
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text)
-        # Remove empty lines
-        text = re.sub(r'\n\s*\n', '\n', text)
-        return text.strip()
\ No newline at end of file
+        # Collapse every whitespace run (newlines included) to a single space
+        return ' '.join(text.split())
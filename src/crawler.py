@@ -1,63 +1,243 @@
 import asyncio
 import aiohttp
 import logging
-from typing import List, Dict, Set, DefaultDict
+from typing import List, Dict, Set, Counter as CounterT, Deque, FrozenSet, Iterator, Optional, Tuple
 from pathlib import Path
 import time
-from urllib.parse import urlparse
+from urllib.parse import urlunsplit
 import sys
+import os
 import random
-from collections import defaultdict
-from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import aiodns  # Enables aiohttp's asynchronous DNS resolver
+except ImportError:
+    aiodns = None
 
 from .config import CrawlerConfig
 from .content_extractor import ContentExtractor
-from .url_handler import URLHandler
+from .url_handler import URLHandler, _cached_split
+from .url_manager import _fold_url
 from .site_mapper import SiteMapper
 
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# File extensions of links that never lead to HTML pages
+_NON_HTML_EXTS = (
+    '.pdf', '.doc', '.docx', '.ppt', '.pptx', '.xls', '.xlsx',
+    '.zip', '.rar', '.tar', '.gz', '.jpg', '.jpeg', '.png', '.gif',
+    '.mp3', '.mp4', '.avi', '.mov', '.wmv', '.flv', '.csv', '.xml'
+)
+
+# Seconds before URLs held for a half-open circuit check again whether its probe has finished
+_HALF_OPEN_RECHECK = 0.5
+
+# error_counts keys for HTTP statuses, built once instead of formatted per response
+_HTTP_ERROR_TYPES = tuple(sys.intern(f"HTTP {status}") for status in range(600))
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Return the seconds to wait given by a Retry-After header (delay or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _http_error_type(status: int) -> str:
+    """Return the error_counts key of an HTTP status."""
+    if 0 <= status < len(_HTTP_ERROR_TYPES):
+        return _HTTP_ERROR_TYPES[status]
+    return f"HTTP {status}"
+
+def _canon(url: str) -> str:
+    """
+    Return the canonical form of a URL used to de-duplicate crawl state.
+    
+    The scheme and host are lowercased, default ports and the fragment are
+    dropped, an empty path becomes '/' and query parameters are sorted, so
+    spelling variants of the same page share a single entry.
+    """
+    try:
+        parts = _cached_split(url)
+        scheme = parts.scheme.lower()
+        host = parts.hostname or ''
+        if ':' in host:
+            host = f'[{host}]'  # IPv6 literal
+        port = parts.port
+    except ValueError:
+        return url.partition('#')[0]
+    netloc = host if port is None or _DEFAULT_PORTS.get(scheme) == port else f'{host}:{port}'
+    if parts.username is not None:
+        netloc = parts.netloc.rpartition('@')[0] + '@' + netloc
+    query = '&'.join(sorted(parts.query.split('&'))) if parts.query else ''
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+def _domain_of(url: str) -> str:
+    """Return the host key the circuit breaker and crawl delay use for a URL."""
+    return _cached_split(url).netloc
+
+class _DomainState:
+    """Circuit breaker bookkeeping for one domain, kept together so each event hashes the domain once."""
+    
+    __slots__ = ('failures', 'open_until', 'probes', 'timeout')
+    
+    def __init__(self, threshold: int, timeout: float):
+        # Times of the domain's most recent failures
+        self.failures: Deque[float] = deque(maxlen=threshold)
+        self.open_until: Optional[float] = None  # time.monotonic() at which an open circuit expires
+        self.probes: Optional[int] = None  # Probes that may still be sent while half-open
+        self.timeout = timeout  # How long the circuit opens for, doubled by failed probes
+
 class CircuitBreaker:
-    """Circuit breaker implementation to prevent overwhelming servers with errors."""
+    """
+    Circuit breaker implementation to prevent overwhelming servers with errors.
     
-    def __init__(self, threshold: int, timeout: int):
+    An open circuit rejects every request to its domain until its timeout expires.
+    The circuit then turns half-open and lets `probe_budget` requests through: a
+    successful probe closes it, a failed one opens it again for twice as long.
+    """
+    
+    def __init__(self, threshold: int, timeout: int, window_seconds: float = 60.0,
+                 probe_budget: int = 1, max_timeout: Optional[float] = None):
         self.threshold = threshold
         self.timeout = timeout
-        self.failures: DefaultDict[str, int] = defaultdict(int)
-        self.open_circuits: Dict[str, datetime] = {}
+        self.window_seconds = window_seconds
+        self.probe_budget = probe_budget
+        self.max_timeout = max_timeout if max_timeout is not None else timeout * 8
+        # Only domains that have failed get an entry; the circuit opens when
+        # `threshold` of their failures fall within `window_seconds`
+        self.state: Dict[str, _DomainState] = {}
         self.logger = logging.getLogger(__name__)
     
-    def record_failure(self, domain: str) -> None:
-        """Record a failure for a domain and open circuit if threshold is reached."""
-        self.failures[domain] += 1
-        if self.failures[domain] >= self.threshold and domain not in self.open_circuits:
+    def record_failure(self, domain: str, retry_after: Optional[float] = None) -> None:
+        """
+        Record a failure for a domain and open circuit if threshold is reached.
+        
+        A Retry-After delay sent by the server keeps the circuit open at least
+        that long (up to max_timeout), whatever the failure count.
+        """
+        state = self.state.get(domain)
+        if state is None:
+            state = self.state[domain] = _DomainState(self.threshold, self.timeout)
+        self._record_failure(domain, state)
+        if retry_after:
+            hold_until = time.monotonic() + min(retry_after, self.max_timeout)
+            if hold_until > (state.open_until or 0.0):
+                self.logger.warning(f"Circuit breaker opened for domain: {domain} (Retry-After {retry_after:.0f}s)")
+                state.probes = None
+                state.open_until = hold_until
+    
+    def _record_failure(self, domain: str, state: _DomainState) -> None:
+        if state.probes is not None:
+            # The host is still failing, back off for longer before probing again
+            state.probes = None
+            state.timeout = min(self.max_timeout, state.timeout * 2)
+            state.failures.clear()
+            self.logger.warning(f"Circuit breaker reopened for domain: {domain} ({state.timeout}s)")
+            state.open_until = time.monotonic() + state.timeout
+            return
+        recent = state.failures
+        recent.append(time.monotonic())
+        if (len(recent) == self.threshold and recent[-1] - recent[0] <= self.window_seconds
+                and state.open_until is None):
             self.logger.warning(f"Circuit breaker opened for domain: {domain}")
-            self.open_circuits[domain] = datetime.now() + timedelta(seconds=self.timeout)
+            state.open_until = time.monotonic() + state.timeout
     
     def record_success(self, domain: str) -> None:
         """Record a success for a domain and reset failure count."""
-        if domain in self.failures:
-            self.failures[domain] = 0
+        state = self.state.get(domain)
+        if state is None:
+            return
+        if state.probes is not None:
+            self.logger.info(f"Circuit breaker closed for domain: {domain}")
+            state.probes = None
+            state.timeout = self.timeout
+        state.failures.clear()
     
     def is_open(self, domain: str) -> bool:
-        """Check if circuit is open for a domain."""
-        if domain in self.open_circuits:
-            if datetime.now() > self.open_circuits[domain]:
-                # Circuit timeout has expired, close the circuit
-                self.logger.info(f"Circuit breaker closed for domain: {domain}")
-                del self.open_circuits[domain]
-                self.failures[domain] = 0
-                return False
-            return True
-        return False
+        """Check if circuit is open for a domain, or half-open with no probes left."""
+        state = self.state.get(domain)
+        if state is None:
+            return False
+        if state.open_until is not None:
+            if time.monotonic() <= state.open_until:
+                return True
+            # Circuit timeout has expired, let a few probes through
+            self.logger.info(f"Circuit breaker half-open for domain: {domain}")
+            state.open_until = None
+            state.failures.clear()
+            state.probes = self.probe_budget
+        return state.probes == 0
+    
+    def next_probe_at(self, domain: str) -> Optional[float]:
+        """Return the time.monotonic() at which an open circuit lets probes through, or None if not open."""
+        state = self.state.get(domain)
+        return state.open_until if state is not None else None
+    
+    def acquire(self, domain: str) -> bool:
+        """Check if a request to the domain may be sent, taking a probe if the circuit is half-open."""
+        if self.is_open(domain):
+            return False
+        state = self.state.get(domain)
+        if state is not None and state.probes is not None:
+            state.probes -= 1
+        return True
+    
+    def release(self, domain: str) -> None:
+        """Return a probe taken by acquire() whose request neither succeeded nor failed."""
+        state = self.state.get(domain)
+        if state is not None and state.probes is not None:
+            state.probes = min(self.probe_budget, state.probes + 1)
+
+class RetryPolicy:
+    """Decides which responses are retried and how long to wait before each retry."""
+    
+    def __init__(self, max_retries: int, base_delay: float, max_delay: float,
+                 retry_statuses: FrozenSet[int] = frozenset(range(500, 600))):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = retry_statuses
+    
+    def is_retryable_status(self, status: int) -> bool:
+        """Check if a response with this status should be retried."""
+        return status in self.retry_statuses
+    
+    def delays(self) -> Iterator[float]:
+        """Yield the wait before each retry of one URL; runs out after max_retries."""
+        delay = self.base_delay
+        for _ in range(self.max_retries):
+            # Decorrelated jitter keeps peers retrying the same failing host from syncing up
+            delay = min(self.max_delay, random.uniform(self.base_delay, delay * 3))
+            yield delay
 
 class Crawler:
     """Main crawler class that orchestrates the web crawling process."""
     
-    def __init__(self, config: CrawlerConfig):
+    def __init__(self, config: CrawlerConfig, connector: Optional[aiohttp.BaseConnector] = None):
         self.config = config
+        # Connector supplied by the caller, who keeps ownership of it
+        self._connector = connector
         self.extractor = ContentExtractor()
-        self.site_mapper = SiteMapper()
+        self.site_mapper = SiteMapper(
+            config.output_path.with_suffix('.ndjson') if config.stream_pages else None,
+            config.deduplicate_content
+        )
         self.logger = logging.getLogger(__name__)
         
+        # Settings read on every request; the config is frozen, so copies stay valid
+        self._delay = config.delay
+        self._max_retries = config.max_retries
+        self._max_links = config.max_links
+        self._max_depth = config.max_depth
+        
         # Dictionary to store URL handlers for each starting URL
         self.url_handlers = {}
         
@@ -66,22 +246,46 @@ class Crawler:
         self.failed_urls: Set[str] = set()
         self.current_depth = 0
         self.total_links = 0
-        self.links_lock = asyncio.Lock()  # Lock for synchronizing access to total_links
-        
-        # Create a semaphore to limit the number of URLs crawled
-        # We use a higher value for the semaphore to allow parallel crawling
-        # but we'll still stop when total_links reaches max_links
-        self.links_semaphore = asyncio.Semaphore(min(100, self.config.max_links * 2))
         self.stop_crawling = False  # Flag to signal when to stop crawling
         
+        # Frontier of (url, depth, origin_url) items consumed by the worker pool,
+        # plus the folded form of every URL ever placed on it so each page is
+        # only queued once (visited_urls and failed_urls hold canonical URLs)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._enqueued: Set[str] = set()
+        # Items of domains whose circuit is open, parked until the breaker lets
+        # requests through again, and the one timer per domain that re-queues them
+        self._held: Dict[str, List[Tuple[str, int, str]]] = {}
+        self._hold_timers: Set[asyncio.Task] = set()
+        
         # Initialize circuit breaker
         self.circuit_breaker = CircuitBreaker(
             self.config.circuit_breaker_threshold,
-            self.config.circuit_breaker_timeout
+            self.config.circuit_breaker_timeout,
+            self.config.circuit_breaker_window
+        )
+        
+        # Retry policy for timeouts, connection errors and retryable statuses
+        self.retry_policy = RetryPolicy(
+            self.config.max_retries,
+            self.config.retry_delay,
+            self.config.max_retry_delay
         )
         
         # Error tracking
-        self.error_counts: DefaultDict[str, int] = defaultdict(int)
+        self.error_counts: CounterT[str] = Counter()
+        
+        # HTTP session shared by every crawl() call, created on first use
+        self._session: Optional[aiohttp.ClientSession] = None
+        
+        # Thread pool that parses pages off the event loop, created on first use
+        self._executor: Optional[ThreadPoolExecutor] = None
+        
+        # Per-host lock and time of the last request, used to apply the crawl
+        # delay to each host separately instead of to every request globally
+        self._host_gate: Dict[str, Tuple[asyncio.Lock, float]] = {}
+        # Counts unexpected errors so only a sample of them log a full traceback
+        self._exc_sample = 0
 
     async def crawl(self, start_urls: List[str]) -> Dict:
         """
@@ -99,22 +303,37 @@ class Crawler:
             
         # Initialize URL handlers for each starting URL
         for url in start_urls:
-            url_handler = URLHandler(url, self.config.respect_robots_txt, self.config.exclude_keywords)
-            url_handler.same_path_only = self.config.same_path_only
+            url_handler = URLHandler(url, self.config.respect_robots_txt, self.config.exclude_keywords,
+                                     self.config.exclusion_patterns, self.config.same_path_only)
             self.url_handlers[url] = url_handler
         
-        # Configure client session with proper headers and timeouts
-        timeout = aiohttp.ClientTimeout(total=self.config.timeout)
-        headers = {"User-Agent": self.config.user_agent}
+        session = self._get_session()
         
-        async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
-            # Create tasks for each starting URL
-            tasks = []
-            for url in start_urls:
-                tasks.append(self._crawl_url(session, url, 0, url))  # Pass the starting URL as the origin
-                
-            # Wait for all tasks to complete
-            await asyncio.gather(*tasks)
+        # Load robots.txt for every starting domain before the first page fetch
+        await asyncio.gather(*(handler.load_robots(session) for handler in self.url_handlers.values()))
+        
+        # Seed the queue with the starting URLs, each being its own origin
+        for url in start_urls:
+            self._enqueue(url, 0, url)
+        
+        # Start a bounded pool of workers and wait until the queue is drained
+        workers = [
+            asyncio.create_task(self._worker(session))
+            for _ in range(self.config.max_concurrency)
+        ]
+        try:
+            # Held URLs go back on the queue when their timer fires, so the
+            # crawl is only over once both are empty
+            while True:
+                await self._queue.join()
+                if not self._hold_timers or self.stop_crawling:
+                    break
+                await asyncio.wait(set(self._hold_timers))
+        finally:
+            for task in [*workers, *self._hold_timers]:
+                task.cancel()
+            await asyncio.gather(*workers, *self._hold_timers, return_exceptions=True)
+            self._held.clear()
             
         # Log error statistics
         if self.error_counts:
@@ -124,9 +343,101 @@ class Crawler:
             
         return self.site_mapper.generate_output(start_urls)
 
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Return the shared client session, creating it on first use.
+        
+        Keeping one session (and its connection pool and DNS cache) alive across
+        crawl() calls avoids paying TCP and TLS handshakes again for every run.
+        """
+        if self._session is None or self._session.closed:
+            connector = self._connector or aiohttp.TCPConnector(
+                limit=self.config.max_concurrency,
+                limit_per_host=self.config.per_host_concurrency,  # Stay polite towards any single host
+                ttl_dns_cache=300,
+                use_dns_cache=True,
+                enable_cleanup_closed=True,
+                resolver=self._make_resolver()
+            )
+            # Configure client session with proper headers and timeouts
+            timeout = aiohttp.ClientTimeout(total=self.config.timeout)
+            headers = {"User-Agent": self.config.user_agent}
+            self._session = aiohttp.ClientSession(
+                connector=connector, headers=headers, timeout=timeout,
+                connector_owner=self._connector is None
+            )
+        return self._session
+
+    def _make_resolver(self) -> Optional[aiohttp.abc.AbstractResolver]:
+        """Return an asynchronous DNS resolver, or None for aiohttp's default."""
+        if aiodns is None:
+            if self.config.nameservers:
+                self.logger.warning("aiodns is not installed, ignoring configured nameservers")
+            return None
+        if self.config.nameservers:
+            return aiohttp.AsyncResolver(nameservers=self.config.nameservers)
+        return aiohttp.AsyncResolver()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Return the parsing thread pool, creating it if needed."""
+        if self._executor is None:
+            # lxml and selectolax release the GIL while parsing, so one thread per core pays off
+            self._executor = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="crawler-parse")
+        return self._executor
+
+    async def aclose(self) -> None:
+        """Close the shared client session and parsing threads."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _enqueue(self, url: str, depth: int, origin_url: str) -> None:
+        """Queue a URL for crawling unless it, or another spelling of the same page, has been queued before."""
+        # http/https, www/bare and '/' vs '/index.html' spellings share one entry
+        frontier_key = _fold_url(_canon(url))
+        if frontier_key in self._enqueued:
+            return
+        self._enqueued.add(frontier_key)
+        self._queue.put_nowait((url, depth, origin_url))
+
+    def _hold(self, domain: str, url: str, depth: int, origin_url: str) -> None:
+        """Park a URL of a domain whose circuit is open until its next probe time."""
+        held = self._held.get(domain)
+        if held is None:
+            # One timer per domain, so parked URLs do not each wake up to poll the breaker
+            held = self._held[domain] = []
+            timer = asyncio.create_task(self._release_held(domain))
+            self._hold_timers.add(timer)
+            timer.add_done_callback(self._hold_timers.discard)
+        held.append((url, depth, origin_url))
+
+    async def _release_held(self, domain: str) -> None:
+        """Put a domain's held URLs back on the queue once its circuit lets requests through."""
+        probe_at = self.circuit_breaker.next_probe_at(domain)
+        wait = probe_at - time.monotonic() if probe_at is not None else _HALF_OPEN_RECHECK
+        await asyncio.sleep(max(0.0, wait))
+        for item in self._held.pop(domain, ()):
+            self._queue.put_nowait(item)
+
+    async def _worker(self, session: aiohttp.ClientSession) -> None:
+        """Crawl URLs taken from the queue until cancelled."""
+        while True:
+            url, depth, origin_url = await self._queue.get()
+            try:
+                # Once max_links is reached the remaining queue is only drained
+                if not self.stop_crawling:
+                    await self._crawl_url(session, url, depth, origin_url)
+            except Exception as e:
+                self.logger.error(f"Unexpected error crawling {url}: {type(e).__name__}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
     async def _crawl_url(self, session: aiohttp.ClientSession, url: str, depth: int, origin_url: str) -> None:
         """
-        Crawl a single URL and its links up to the specified depth.
+        Crawl a single URL and queue its links up to the specified depth.
         
         Args:
             session: The aiohttp client session
@@ -138,244 +449,248 @@ class Crawler:
         if self.stop_crawling:
             return
             
-        # Try to acquire a semaphore permit
-        # If we can't acquire it, it means we've reached the max_links limit
-        if not self.links_semaphore.locked():
-            try:
-                # Use a non-blocking acquire to check if we can get a permit
-                if not await asyncio.wait_for(self.links_semaphore.acquire(), 0.1):
-                    return
-            except asyncio.TimeoutError:
-                # If we time out waiting for the semaphore, it means we've reached the limit
-                return
-        else:
-            # Semaphore is already locked, which means we've reached the limit
+        # Check if circuit breaker is open for this domain first; it is the
+        # cheapest check and rejects every URL of a failing host
+        domain = _domain_of(url)
+        if self.circuit_breaker.is_open(domain):
+            probe_at = self.circuit_breaker.next_probe_at(domain)
+            wait = f", next probe in {probe_at - time.monotonic():.0f}s" if probe_at else ""
+            self.logger.info(f"Holding {url}: Circuit breaker is open for domain {domain}{wait}")
+            self._hold(domain, url, depth, origin_url)
             return
             
+        # Load (or start refreshing) the robots.txt rules of the URL's own origin, which
+        # may differ from the start URL's, e.g. an http:// link on an https:// site
+        await self.url_handlers[origin_url].load_robots(session, url)
+        
+        # Check if URL should be crawled (is_valid_url also applies the exclusion
+        # patterns and keywords). Only successfully crawled pages count toward max_links.
+        if not self._should_crawl(url, depth, origin_url):
+            return
+
+        canonical_url = _canon(url)
+        
+        # A recovering host only gets a few probe requests, the others wait for them
+        if not self.circuit_breaker.acquire(domain):
+            self._hold(domain, url, depth, origin_url)
+            return
+
+        # Errors are tallied locally and merged into error_counts once the URL is done
+        errors: CounterT[str] = Counter()
+        # Waits before each retry of this URL; the loop ends once they run out
+        retry_delays = self.retry_policy.delays()
+        attempt = 1
+        
         try:
-            # Check if URL should be crawled (this includes checking for excluded URLs)
-            url_handler = self.url_handlers[origin_url]
-            
-            # First check if the URL is excluded by keywords or patterns
-            # This way we don't count excluded URLs toward the max-links limit
-            parsed_url = urlparse(url)
-            path = parsed_url.path.lower()
-            
-            # Check if URL is excluded by keywords
-            if url_handler._is_excluded_url(url):
-                # Release the semaphore since we're not actually crawling this URL
-                self.links_semaphore.release()
-                return
-                
-            if not self._should_crawl(url, depth, origin_url):
-                # Release the semaphore if we decide not to crawl this URL
-                self.links_semaphore.release()
-                return
-
-            # Check if circuit breaker is open for this domain
-            domain = urlparse(url).netloc
-            if self.circuit_breaker.is_open(domain):
-                self.logger.info(f"Skipping {url}: Circuit breaker is open for domain {domain}")
-                # Release the semaphore if we decide not to crawl this URL
-                self.links_semaphore.release()
-                return
-
-            # Initialize retry counter
-            retry_count = 0
-            
-            while retry_count <= self.config.max_retries:
+            while True:
+                # Error type and description of a retryable failure in this attempt
+                transient_error: Optional[Tuple[str, str]] = None
+                # Seconds the server asked us to wait with a Retry-After header
+                retry_after: Optional[float] = None
                 try:
-                    # Respect crawl delay
-                    await asyncio.sleep(self.config.delay)
+                    # Respect crawl delay for this host
+                    await self._respect_delay(domain)
                     
                     # Fetch and process the page
-                    try:
-                        async with session.get(url) as response:
-                            status = response.status
-                            
-                            # Handle different HTTP status codes
-                            if status == 200:
-                                # Check content type before processing
-                                content_type = response.headers.get('Content-Type', '').lower()
-                                if not ('text/html' in content_type or 'application/xhtml+xml' in content_type):
-                                    self.logger.info(f"Skipping non-HTML content: {url} (Content-Type: {content_type})")
-                                    self.visited_urls.add(url)  # Mark as visited to avoid retrying
-                                    break
-                                    
-                                try:
-                                    html = await response.text()
-                                except UnicodeDecodeError as e:
-                                    self.logger.warning(f"Failed to decode content from {url}: {str(e)}")
-                                    self.visited_urls.add(url)  # Mark as visited to avoid retrying
-                                    break
-                                
-                                # Record success for circuit breaker
-                                self.circuit_breaker.record_success(domain)
-                                
-                                # Extract content
-                                content = self.extractor.extract_content(html, url)
-                                
-                                # Extract links using the appropriate URL handler
-                                url_handler = self.url_handlers[origin_url]
-                                links = url_handler.extract_links(html, url)
-                                internal_links = [link for link in links if url_handler.is_internal_url(link)]
-                                
-                                # Update site map
-                                self.site_mapper.add_page(url, internal_links, depth, content)
-                                self.visited_urls.add(url)
-                                
-                                # Increment total_links with lock - only count successfully crawled pages
-                                async with self.links_lock:
-                                    self.total_links += 1
-                                    # Check if we've reached the max_links limit
-                                    if self.total_links >= self.config.max_links:
-                                        self.logger.info(f"Reached maximum number of links ({self.config.max_links}), stopping crawl")
-                                        self.stop_crawling = True
-                                
-                                # Crawl links if within limits and not stopping
-                                if depth < self.config.max_depth and not self.stop_crawling:
-                                    tasks = []
-                                    for link in internal_links:
-                                        if self._should_crawl(link, depth + 1, origin_url):
-                                            tasks.append(self._crawl_url(session, link, depth + 1, origin_url))
-                                            
-                                    if tasks:
-                                        await asyncio.gather(*tasks)
-                                
-                                # Successfully processed, break the retry loop
-                                break
-                                
-                            elif 500 <= status < 600:
-                                # Server error, retry with backoff
-                                error_type = f"HTTP {status}"
-                                self.error_counts[error_type] += 1
-                                self.logger.warning(f"Server error for {url}: Status {status}, attempt {retry_count + 1}/{self.config.max_retries + 1}")
-                                
-                                # Record failure for circuit breaker
-                                self.circuit_breaker.record_failure(domain)
-                                
-                                # If we've reached max retries, mark as failed
-                                if retry_count == self.config.max_retries:
-                                    self.logger.error(f"Failed to fetch {url} after {self.config.max_retries + 1} attempts: Status {status}")
-                                    self.failed_urls.add(url)
-                                    break
-                                    
-                                # Exponential backoff with jitter
-                                backoff_time = self.config.retry_delay * (2 ** retry_count) + random.uniform(0, 1)
-                                self.logger.debug(f"Retrying {url} in {backoff_time:.2f} seconds")
-                                await asyncio.sleep(backoff_time)
-                                retry_count += 1
-                                continue
-                                
-                            elif 400 <= status < 500:
-                                # Client error, don't retry
-                                error_type = f"HTTP {status}"
-                                self.error_counts[error_type] += 1
-                                self.logger.warning(f"Client error for {url}: Status {status}")
-                                self.failed_urls.add(url)
+                    async with session.get(url) as response:
+                        status = response.status
+                        
+                        # Handle different HTTP status codes
+                        if status == 200:
+                            # Check content type before processing
+                            content_type = response.headers.get('Content-Type', '').lower()
+                            if not ('text/html' in content_type or 'application/xhtml+xml' in content_type):
+                                self.logger.info(f"Skipping non-HTML content: {url} (Content-Type: {content_type})")
+                                self.visited_urls.add(canonical_url)  # Mark as visited to avoid retrying
+                                # Drop the connection rather than let the rest of the body arrive
+                                response.close()
                                 break
                                 
-                            else:
-                                # Other status codes, don't retry
-                                error_type = f"HTTP {status}"
-                                self.error_counts[error_type] += 1
-                                self.logger.warning(f"Unexpected status for {url}: Status {status}")
-                                self.failed_urls.add(url)
-                                break
-                    
-                    except asyncio.TimeoutError:
-                        error_type = "Timeout"
-                        self.error_counts[error_type] += 1
-                        self.logger.warning(f"Timeout for {url}, attempt {retry_count + 1}/{self.config.max_retries + 1}")
-                        
-                        # Record failure for circuit breaker
-                        self.circuit_breaker.record_failure(domain)
-                        
-                        # If we've reached max retries, mark as failed
-                        if retry_count == self.config.max_retries:
-                            self.logger.error(f"Failed to fetch {url} after {self.config.max_retries + 1} attempts: Timeout")
-                            self.failed_urls.add(url)
+                            html = await self._read_html(response, url)
+                            
+                            # Record success for circuit breaker
+                            self.circuit_breaker.record_success(domain)
+                            
+                            # Extract content, its duplicate fingerprint and links off the event loop
+                            content, fingerprint, internal_links = await asyncio.get_running_loop().run_in_executor(
+                                self._get_executor(), self._process_page, html, url, self.url_handlers[origin_url]
+                            )
+                            
+                            # Update site map
+                            self.site_mapper.add_page(url, internal_links, depth, content, fingerprint)
+                            self.visited_urls.add(canonical_url)
+                            
+                            # Increment total_links - only count successfully crawled pages.
+                            # There is no await between the increment and the check, so this
+                            # is atomic with respect to the other workers on the event loop.
+                            self.total_links += 1
+                            # Check if we've reached the max_links limit
+                            if self.total_links >= self._max_links:
+                                self.logger.info(f"Reached maximum number of links ({self._max_links}), stopping crawl")
+                                self.stop_crawling = True
+                            
+                            # Crawl links if within limits and not stopping
+                            if depth < self._max_depth and not self.stop_crawling:
+                                for link in internal_links:
+                                    if self._should_crawl(link, depth + 1, origin_url):
+                                        self._enqueue(link, depth + 1, origin_url)
+                            
+                            # Successfully processed, break the retry loop
+                            break
+                            
+                        elif self.retry_policy.is_retryable_status(status):
+                            # Server error, retry with backoff once the response is released
+                            transient_error = (_http_error_type(status), f"Server error (status {status})")
+                            retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+                            
+                        elif 400 <= status < 500:
+                            # Client error, don't retry
+                            error_type = _http_error_type(status)
+                            errors[error_type] += 1
+                            self.logger.warning(f"Client error for {url}: Status {status}")
+                            self.failed_urls.add(canonical_url)
+                            break
+                            
+                        else:
+                            # Other status codes, don't retry
+                            error_type = _http_error_type(status)
+                            errors[error_type] += 1
+                            self.logger.warning(f"Unexpected status for {url}: Status {status}")
+                            self.failed_urls.add(canonical_url)
                             break
                             
-                        # Exponential backoff with jitter
-                        backoff_time = self.config.retry_delay * (2 ** retry_count) + random.uniform(0, 1)
-                        self.logger.debug(f"Retrying {url} in {backoff_time:.2f} seconds")
-                        await asyncio.sleep(backoff_time)
-                        retry_count += 1
-                        continue
-                        
                 except asyncio.TimeoutError:
-                    error_type = "Timeout"
-                    self.error_counts[error_type] += 1
-                    self.logger.warning(f"Timeout for {url}, attempt {retry_count + 1}/{self.config.max_retries + 1}")
-                    
-                    # Record failure for circuit breaker
-                    self.circuit_breaker.record_failure(domain)
-                    
-                    # If we've reached max retries, mark as failed
-                    if retry_count == self.config.max_retries:
-                        self.logger.error(f"Failed to fetch {url} after {self.config.max_retries + 1} attempts: Timeout")
-                        self.failed_urls.add(url)
-                        break
-                        
-                    # Exponential backoff with jitter
-                    backoff_time = self.config.retry_delay * (2 ** retry_count) + random.uniform(0, 1)
-                    self.logger.debug(f"Retrying {url} in {backoff_time:.2f} seconds")
-                    await asyncio.sleep(backoff_time)
-                    retry_count += 1
+                    transient_error = ("Timeout", "Timeout")
                     
                 except aiohttp.ClientError as e:
                     error_type = type(e).__name__
-                    self.error_counts[error_type] += 1
-                    self.logger.warning(f"Client error for {url}: {error_type}: {str(e)}, attempt {retry_count + 1}/{self.config.max_retries + 1}")
-                    
-                    # Record failure for circuit breaker
-                    self.circuit_breaker.record_failure(domain)
-                    
-                    # If we've reached max retries, mark as failed
-                    if retry_count == self.config.max_retries:
-                        self.logger.error(f"Failed to fetch {url} after {self.config.max_retries + 1} attempts: {error_type}: {str(e)}")
-                        self.failed_urls.add(url)
-                        break
-                        
-                    # Exponential backoff with jitter
-                    backoff_time = self.config.retry_delay * (2 ** retry_count) + random.uniform(0, 1)
-                    self.logger.debug(f"Retrying {url} in {backoff_time:.2f} seconds")
-                    await asyncio.sleep(backoff_time)
-                    retry_count += 1
+                    transient_error = (error_type, f"Client error {error_type}: {str(e)}")
                     
                 except Exception as e:
-                    # Special case for test scenarios where session.get() raises a TimeoutError directly
-                    if isinstance(e, asyncio.TimeoutError):
-                        error_type = "Timeout"
-                        self.error_counts[error_type] += 1
-                        self.logger.warning(f"Timeout for {url}, attempt {retry_count + 1}/{self.config.max_retries + 1}")
-                        
-                        # Record failure for circuit breaker
-                        self.circuit_breaker.record_failure(domain)
-                        
-                        # If we've reached max retries, mark as failed
-                        if retry_count == self.config.max_retries:
-                            self.logger.error(f"Failed to fetch {url} after {self.config.max_retries + 1} attempts: Timeout")
-                            self.failed_urls.add(url)
-                            break
-                            
-                        # Exponential backoff with jitter
-                        backoff_time = self.config.retry_delay * (2 ** retry_count) + random.uniform(0, 1)
-                        self.logger.debug(f"Retrying {url} in {backoff_time:.2f} seconds")
-                        await asyncio.sleep(backoff_time)
-                        retry_count += 1
-                    else:
-                        error_type = type(e).__name__
-                        self.error_counts[error_type] += 1
+                    error_type = type(e).__name__
+                    errors[error_type] += 1
+                    self._exc_sample += 1
+                    if self._exc_sample % 100 == 1:
                         self.logger.error(f"Error crawling {url}: {error_type}: {str(e)}", exc_info=True)
-                        self.failed_urls.add(url)
-                        break
+                    else:
+                        self.logger.warning(f"Error crawling {url}: {error_type}: {str(e)}")
+                    self.failed_urls.add(canonical_url)
+                    break
+                
+                error_type, description = transient_error
+                errors[error_type] += 1
+                if not await self._handle_transient(url, canonical_url, domain, attempt, retry_delays,
+                                                    description, retry_after):
+                    break
+                attempt += 1
         finally:
-            # Always release the semaphore when we're done with this URL
-            # Note: For error URLs, we release the semaphore without incrementing total_links
-            # This ensures that error URLs don't count toward the max_links limit
-            self.links_semaphore.release()
+            self.error_counts.update(errors)
+            # Hand back the probe if the response was neither a success nor a failure
+            self.circuit_breaker.release(domain)
+
+    def _process_page(self, html: str, url: str,
+                      url_handler: URLHandler) -> Tuple[Dict, Optional[Tuple[bytes, int]], List[str]]:
+        """Extract a page's content, duplicate fingerprint and internal links; runs in the parsing executor."""
+        content = self.extractor.extract_content(html, url)
+        dedup = self.site_mapper.dedup
+        fingerprint = dedup.fingerprint(content['content']) if dedup and content.get('content') else None
+        internal_links = url_handler.filter_batch(url_handler.extract_links(html, url))
+        return content, fingerprint, internal_links
+
+    async def _read_html(self, response: aiohttp.ClientResponse, url: str) -> str:
+        """
+        Read a response body up to config.max_page_bytes and decode it.
+        
+        Args:
+            response: The response to read
+            url: URL of the response, for logging
+            
+        Returns:
+            The decoded (and possibly truncated) HTML
+        """
+        reader = response.content
+        buf = bytearray()
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                break
+            buf += chunk
+            if len(buf) > self.config.max_page_bytes:
+                self.logger.debug(f"Truncating {url} at {self.config.max_page_bytes} bytes")
+                del buf[self.config.max_page_bytes:]
+                break
+        
+        # Use the declared charset instead of guessing it from the body
+        encoding = response.charset or 'utf-8'
+        try:
+            return buf.decode(encoding, errors='replace')
+        except LookupError:
+            self.logger.debug(f"Unknown charset {encoding!r} for {url}, decoding as utf-8")
+            return buf.decode('utf-8', errors='replace')
+
+    async def _handle_transient(self, url: str, canonical_url: str, domain: str, attempt: int,
+                                retry_delays: Iterator[float], description: str,
+                                retry_after: Optional[float] = None) -> bool:
+        """
+        Record a retryable failure and back off before the next attempt.
+        
+        Args:
+            url: The URL that failed
+            canonical_url: Canonical form of the URL, as stored in failed_urls
+            domain: Domain of the URL, for the circuit breaker
+            attempt: Number of the attempt that failed, starting at 1
+            retry_delays: The URL's remaining waits from retry_policy.delays()
+            description: Human readable description of the failure for the logs
+            retry_after: Seconds the server asked to wait before the next request, if any.
+                Up to max_retry_delay the host's next request waits that long, beyond
+                it the domain's circuit stays open that long and the URL is not retried
+            
+        Returns:
+            True if the URL should be retried, False once it has used up its
+            retries or its domain's circuit has opened, and has been marked as failed
+        """
+        self.logger.warning(f"{description} for {url}, attempt {attempt}/{self._max_retries + 1}")
+        
+        if retry_after is not None and retry_after <= self.config.max_retry_delay:
+            # A short Retry-After only holds back this host's next request,
+            # which is this URL's retry
+            self._delay_host(domain, retry_after)
+            retry_after = None
+        
+        # Record failure for circuit breaker; a longer Retry-After opens its circuit
+        self.circuit_breaker.record_failure(domain, retry_after)
+        
+        # An open circuit, including one reopened by a failed probe, gets no further requests
+        if self.circuit_breaker.is_open(domain):
+            self.logger.error(f"Giving up on {url} after {attempt} attempts: circuit breaker is open for {domain}")
+            self.failed_urls.add(canonical_url)
+            return False
+        
+        # If we've reached max retries, mark as failed
+        backoff_time = next(retry_delays, None)
+        if backoff_time is None:
+            self.logger.error(f"Failed to fetch {url} after {attempt} attempts: {description}")
+            self.failed_urls.add(canonical_url)
+            return False
+            
+        self.logger.debug(f"Retrying {url} in {backoff_time:.2f} seconds")
+        await asyncio.sleep(backoff_time)
+        return True
+
+    def _delay_host(self, host: str, seconds: float) -> None:
+        """Keep _respect_delay from letting another request through to host for the given time."""
+        lock, last_request = self._host_gate.setdefault(host, (asyncio.Lock(), 0.0))
+        self._host_gate[host] = (lock, max(last_request, time.monotonic() + seconds - self._delay))
+
+    async def _respect_delay(self, host: str) -> None:
+        """Wait until config.delay seconds have passed since the last request to host."""
+        lock, _ = self._host_gate.setdefault(host, (asyncio.Lock(), 0.0))
+        async with lock:
+            _, last_request = self._host_gate[host]
+            elapsed = time.monotonic() - last_request
+            if elapsed < self._delay:
+                await asyncio.sleep(self._delay - elapsed)
+            self._host_gate[host] = (lock, time.monotonic())
 
     def _should_crawl(self, url: str, depth: int, origin_url: str) -> bool:
         """
@@ -390,34 +705,27 @@ class Crawler:
         if self.stop_crawling:
             return False
             
-        # Get the appropriate URL handler for this origin
-        url_handler = self.url_handlers[origin_url]
-        
-        # Get domain for circuit breaker check
-        domain = urlparse(url).netloc
+        # The split is cached, so the domain, path and canonical form share one parse
+        parsed_url = _cached_split(url)
         
         # Check file extension to avoid non-HTML files
-        parsed_url = urlparse(url)
-        path = parsed_url.path.lower()
-        non_html_extensions = [
-            '.pdf', '.doc', '.docx', '.ppt', '.pptx', '.xls', '.xlsx',
-            '.zip', '.rar', '.tar', '.gz', '.jpg', '.jpeg', '.png', '.gif',
-            '.mp3', '.mp4', '.avi', '.mov', '.wmv', '.flv', '.csv', '.xml'
-        ]
-        if any(path.endswith(ext) for ext in non_html_extensions):
+        if parsed_url.path.lower().endswith(_NON_HTML_EXTS):
             self.logger.debug(f"Skipping non-HTML file: {url}")
             return False
         
-        # Note: We don't check for excluded URLs here as that's done separately
-        # before this method is called, to avoid counting them toward max_links
-        return all([
-            url not in self.visited_urls,
-            url not in self.failed_urls,
-            depth <= self.config.max_depth,
-            url_handler.is_valid_url(url),
-            url_handler.can_fetch(url, self.config.user_agent),
-            not self.circuit_breaker.is_open(domain)
-        ])
+        # Get the appropriate URL handler for this origin
+        url_handler = self.url_handlers[origin_url]
+        canonical_url = _canon(url)
+        
+        # Cheapest checks first; robots.txt is only consulted for otherwise crawlable URLs.
+        # Exclusion patterns and keywords are applied by url_handler.is_valid_url
+        return (
+            depth <= self._max_depth
+            and canonical_url not in self.visited_urls
+            and canonical_url not in self.failed_urls
+            and url_handler.is_valid_url(url)
+            and url_handler.can_fetch(url, self.config.user_agent)
+        )
 
     def save_results(self, results: Dict) -> None:
         """Save the crawl results to a file."""
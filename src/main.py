@@ -94,12 +94,44 @@ def parse_arguments():
         help='Crawl only URLs with the same path prefix as the starting URL'
     )
     
+    parser.add_argument(
+        '--stream-pages',
+        action='store_true',
+        help='Write each page to an NDJSON file next to the output as it is crawled'
+    )
+    
+    parser.add_argument(
+        '--deduplicate-content',
+        action='store_true',
+        help='Store the text of pages that exactly or nearly duplicate an earlier page only once'
+    )
+    
     parser.add_argument(
         '--debug',
         action='store_true',
         help='Enable debug logging'
     )
     
+    parser.add_argument(
+        '--max-concurrency',
+        type=int,
+        default=16,
+        help='Maximum number of requests in flight across all hosts (default: 16)'
+    )
+    
+    parser.add_argument(
+        '--per-host-concurrency',
+        type=int,
+        default=8,
+        help='Maximum number of open connections to a single host (default: 8)'
+    )
+    
+    parser.add_argument(
+        '--nameservers',
+        nargs='+',
+        help='DNS servers to resolve hostnames with (requires aiodns; default: system resolvers)'
+    )
+    
     parser.add_argument(
         '--max-retries',
         type=int,
@@ -111,7 +143,7 @@ def parse_arguments():
         '--retry-delay',
         type=float,
         default=1.0,
-        help='Base delay in seconds for retry exponential backoff (default: 1.0)'
+        help='Minimum delay in seconds between retries; later retries back off with jitter (default: 1.0)'
     )
     
     parser.add_argument(
@@ -128,8 +160,23 @@ def parse_arguments():
         help='Time in seconds before circuit breaker resets (default: 300)'
     )
     
+    parser.add_argument(
+        '--circuit-breaker-window',
+        type=float,
+        default=60.0,
+        help='Time window in seconds in which failures count towards the threshold (default: 60)'
+    )
+    
     return parser.parse_args()
 
+def install_event_loop():
+    """Use uvloop's faster event loop when it is installed."""
+    try:
+        import uvloop
+    except ImportError:
+        return
+    uvloop.install()
+
 async def main():
     """Main entry point for the crawler."""
     args = parse_arguments()
@@ -144,21 +191,19 @@ async def main():
         if args.url_file:
             # Read URLs from file
             try:
+                # Single pass; lines after a [exclude_keywords] header are keywords
+                file_exclude_keywords = []
+                in_keywords = False
                 with open(args.url_file, 'r', encoding='utf-8') as f:
-                    lines = [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
-                
-                # Check for exclude keywords section
-                if '[exclude_keywords]' in lines:
-                    # Split the file into URLs and exclude keywords
-                    keyword_section_index = lines.index('[exclude_keywords]')
-                    urls = lines[:keyword_section_index]
-                    
-                    # Get keywords from the section (skip the section header)
-                    file_exclude_keywords = lines[keyword_section_index + 1:]
-                    exclude_keywords.extend(file_exclude_keywords)
-                else:
-                    # No exclude keywords section, all lines are URLs
-                    urls = lines
+                    for raw_line in f:
+                        line = raw_line.strip()
+                        if not line or line[0] == '#':
+                            continue
+                        if line == '[exclude_keywords]':
+                            in_keywords = True
+                            continue
+                        (file_exclude_keywords if in_keywords else urls).append(line)
+                exclude_keywords.extend(file_exclude_keywords)
                 
                 if not urls:
                     logger.error(f"No valid URLs found in {args.url_file}")
@@ -185,17 +230,26 @@ async def main():
             exclude_keywords=exclude_keywords,
             respect_robots_txt=not args.ignore_robots,
             same_path_only=args.same_path_only,
+            stream_pages=args.stream_pages,
+            deduplicate_content=args.deduplicate_content,
+            max_concurrency=args.max_concurrency,
+            per_host_concurrency=args.per_host_concurrency,
+            nameservers=args.nameservers,
             max_retries=args.max_retries,
             retry_delay=args.retry_delay,
             circuit_breaker_threshold=args.circuit_breaker_threshold,
-            circuit_breaker_timeout=args.circuit_breaker_timeout
+            circuit_breaker_timeout=args.circuit_breaker_timeout,
+            circuit_breaker_window=args.circuit_breaker_window
         )
         
         # Initialize and run crawler
         crawler = Crawler(config)
         logger.info(f"Starting crawl of {len(urls)} URLs")
         
-        results = await crawler.crawl(urls)
+        try:
+            results = await crawler.crawl(urls)
+        finally:
+            await crawler.aclose()
         crawler.save_results(results)
         
         logger.info(f"Crawl completed. Results saved to {args.output}")
@@ -210,4 +264,5 @@ async def main():
         return 1
 
 if __name__ == '__main__':
+    install_event_loop()
     sys.exit(asyncio.run(main()))
\ No newline at end of file
@@ -1,19 +1,103 @@
-from typing import Dict, List, Set, Optional
+from typing import BinaryIO, Dict, List, Set, Optional, Tuple
 import json
+import time
+import atexit
+import hashlib
+from collections import Counter
 from datetime import datetime
 import logging
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library encoder
+    orjson = None
+
+_TEXT_CHUNK_SIZE = 1 << 20  # Characters of a large text field escaped per write
+
+def _dumps(obj, indent: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes, with orjson when it is installed."""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode('utf-8')
+
+class ContentDedup:
+    """Detects exact (SHA-256) and near (64-bit SimHash) duplicate page text."""
+    
+    def __init__(self, max_distance: int = 3, shingle_size: int = 3):
+        self.max_distance = max_distance
+        self.shingle_size = shingle_size
+        self.exact_hashes: Set[bytes] = set()
+        # Four 16-bit bands of each SimHash; with at most 3 differing bits, a near
+        # duplicate always shares at least one band, so only those are compared
+        self.bands: List[Dict[int, List[int]]] = [{} for _ in range(4)]
+
+    def simhash(self, text: str) -> int:
+        """Compute a 64-bit SimHash over word shingles of the text."""
+        words = text.lower().split()
+        size = min(self.shingle_size, len(words)) or 1
+        # The 8-byte shingle hashes back to back; byte k of each holds bits 8k..8k+7
+        blob = b''.join(
+            hashlib.blake2b(' '.join(words[i:i + size]).encode('utf-8'), digest_size=8).digest()
+            for i in range(max(1, len(words) - size + 1))
+        )
+        # A bit is set when most shingle hashes set it. Counting each byte column's
+        # values in C leaves at most 256 distinct values per column to test bit by bit
+        half = len(blob) / 16
+        fingerprint = 0
+        for byte in range(8):
+            counts = Counter(blob[byte::8])
+            for bit in range(8):
+                if sum(n for value, n in counts.items() if value >> bit & 1) > half:
+                    fingerprint |= 1 << (8 * byte + bit)
+        return fingerprint
+
+    def fingerprint(self, text: str) -> Tuple[bytes, int]:
+        """Compute the exact and near-duplicate fingerprints of the text; safe to call from worker threads."""
+        return hashlib.sha256(text.encode('utf-8')).digest(), self.simhash(text)
+
+    def is_duplicate(self, text: str, fingerprint: Optional[Tuple[bytes, int]] = None) -> bool:
+        """Return True if the text was seen before, otherwise remember it."""
+        digest, fingerprint = fingerprint or self.fingerprint(text)
+        if digest in self.exact_hashes:
+            return True
+        keys = [fingerprint >> (16 * band) & 0xFFFF for band in range(4)]
+        for band, key in zip(self.bands, keys):
+            for other in band.get(key, ()):
+                if (fingerprint ^ other).bit_count() <= self.max_distance:
+                    return True
+        self.exact_hashes.add(digest)
+        for band, key in zip(self.bands, keys):
+            band.setdefault(key, []).append(fingerprint)
+        return False
+
 class SiteMapper:
     """Manages the site structure and maintains crawl state."""
     
-    def __init__(self):
+    def __init__(self, stream_path: Optional[Path] = None, deduplicate: bool = False):
         self.site_map = {}
-        self.depth_map = {}
         self.concatenated_text = []
         self.logger = logging.getLogger(__name__)
+        # When set, page content is appended to this NDJSON file as pages arrive
+        # instead of being held in memory until the crawl ends
+        self.stream_path = stream_path
+        self._stream: Optional[BinaryIO] = None
+        # Text of pages duplicating an earlier page is not stored again
+        self.dedup: Optional[ContentDedup] = ContentDedup() if deduplicate else None
+        # Formatted timestamp and the monotonic time it was taken
+        self._ts_cache = ('', float('-inf'))
+
+    def _now_iso(self) -> str:
+        """Return the current time in ISO format, refreshed at most once per second."""
+        now = time.monotonic()
+        timestamp, taken_at = self._ts_cache
+        if now - taken_at > 1.0:
+            timestamp = datetime.now().isoformat()
+            self._ts_cache = (timestamp, now)
+        return timestamp
 
-    def add_page(self, url: str, links: List[str], depth: int, content: Dict) -> None:
+    def add_page(self, url: str, links: List[str], depth: int, content: Dict,
+                 fingerprint: Optional[Tuple[bytes, int]] = None) -> None:
         """
         Add a page to the site map with its links and content.
         
@@ -22,17 +106,30 @@ class SiteMapper:
             links: List of links found on the page
             depth: Crawl depth of the page
             content: Extracted content and metadata
+            fingerprint: Precomputed dedup.fingerprint() of the content, if any
         """
         self.site_map[url] = {
             'links': links,
             'depth': depth,
             'title': content.get('title', ''),
-            'timestamp': datetime.now().isoformat()
+            'timestamp': self._now_iso()
         }
         
-        self.depth_map[url] = depth
+        if content.get('content') and self.dedup and self.dedup.is_duplicate(content['content'], fingerprint):
+            self.logger.debug(f"Skipping duplicate content of {url}")
+            return
         
-        if content.get('content'):
+        if self.stream_path is not None:
+            self._write_page({
+                'url': url,
+                'depth': depth,
+                'title': content.get('title', ''),
+                'timestamp': self.site_map[url]['timestamp'],
+                'links': links,
+                'content': content.get('content', ''),
+                'code_blocks': content.get('code_blocks', [])
+            })
+        elif content.get('content'):
             self.concatenated_text.append({
                 'url': url,
                 'title': content.get('title', ''),
@@ -40,9 +137,26 @@ class SiteMapper:
                 'code_blocks': content.get('code_blocks', [])
             })
 
+    def _write_page(self, page: Dict) -> None:
+        """Append one page as a line of the NDJSON stream, opening it on first use."""
+        if self._stream is None:
+            self.stream_path.parent.mkdir(parents=True, exist_ok=True)
+            self._stream = open(self.stream_path, 'wb', buffering=1 << 20)
+            # Interrupted crawls still leave every completed page on disk
+            atexit.register(self.close)
+        self._stream.write(_dumps(page) + b'\n')
+
+    def close(self) -> None:
+        """Flush and close the NDJSON stream, if one is open."""
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+            atexit.unregister(self.close)
+
     def get_page_depth(self, url: str) -> Optional[int]:
         """Get the crawl depth of a page."""
-        return self.depth_map.get(url)
+        page = self.site_map.get(url)
+        return page['depth'] if page else None
 
     def is_visited(self, url: str) -> bool:
         """Check if a URL has been visited."""
@@ -50,7 +164,7 @@ class SiteMapper:
 
     def get_unvisited_links(self, links: List[str]) -> List[str]:
         """Filter out already visited links."""
-        return [link for link in links if not self.is_visited(link)]
+        return list(set(links).difference(self.site_map))
 
     def generate_output(self, start_urls: List[str]) -> Dict:
         """
@@ -67,6 +181,9 @@ class SiteMapper:
             if isinstance(start_urls, str):
                 start_urls = [start_urls]
                 
+            # Streamed page content is already on disk; point to it instead
+            self.close()
+            
             # Prepare the full text content
             full_text = "\n\n".join(
                 f"# {page['title']}\nURL: {page['url']}\n\n{page['content']}"
@@ -76,12 +193,14 @@ class SiteMapper:
             output = {
                 'metadata': {
                     'start_urls': start_urls,
-                    'crawl_date': datetime.now().isoformat(),
+                    'crawl_date': self._now_iso(),
                     'total_pages': len(self.site_map)
                 },
                 'site_map': self.site_map,
                 'llmfulltext': full_text
             }
+            if self.stream_path is not None:
+                output['metadata']['pages_file'] = str(self.stream_path)
 
             return output
 
@@ -90,7 +209,7 @@ class SiteMapper:
             return {
                 'metadata': {
                     'start_urls': start_urls,
-                    'crawl_date': datetime.now().isoformat(),
+                    'crawl_date': self._now_iso(),
                     'total_pages': 0,
                     'error': str(e)
                 },
@@ -103,8 +222,20 @@ class SiteMapper:
         try:
             output_path.parent.mkdir(parents=True, exist_ok=True)
             
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(output, f, indent=2, ensure_ascii=False)
+            with open(output_path, 'wb') as f:
+                f.write(b'{')
+                for i, (key, value) in enumerate(output.items()):
+                    f.write(b',\n' if i else b'\n')
+                    if isinstance(value, str) and len(value) > _TEXT_CHUNK_SIZE:
+                        # Escape large text slice by slice rather than as one more full copy
+                        f.write(b'  ' + _dumps(key) + b': "')
+                        for start in range(0, len(value), _TEXT_CHUNK_SIZE):
+                            f.write(_dumps(value[start:start + _TEXT_CHUNK_SIZE])[1:-1])
+                        f.write(b'"')
+                    else:
+                        # Dump the member as a one-key object and keep its indented body
+                        f.write(_dumps({key: value}, indent=True)[2:-2])
+                f.write(b'\n}')
                 
             self.logger.info(f"Output saved to {output_path}")
             
@@ -1,63 +1,213 @@
-from urllib.parse import urljoin, urlparse
-from typing import List, Set, Optional
+from urllib.parse import SplitResult, urljoin, urlparse, urlsplit
+from typing import Dict, List, Set, Optional, Tuple
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import filterfalse
 import re
+import time
+import asyncio
+import aiohttp
+import fnmatch
 import logging
 from pathlib import Path
 import requests
 from urllib.robotparser import RobotFileParser
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # Fall back to BeautifulSoup with the lxml parser
+    LexborHTMLParser = None
+
+# Only anchors with an href are built when the BeautifulSoup fallback parses pages for links
+_ANCHOR_STRAINER = SoupStrainer('a', href=True)
+
+def _anchor_hrefs(html: str) -> Set[str]:
+    """Return the distinct href values of a page's anchors."""
+    if LexborHTMLParser:
+        return {node.attributes.get('href') or '' for node in LexborHTMLParser(html).css('a[href]')}
+    soup = BeautifulSoup(html, 'lxml', parse_only=_ANCHOR_STRAINER)
+    return {anchor['href'] for anchor in soup.find_all('a', href=True)}
+
+@lru_cache(maxsize=65536)
+def _cached_split(url: str) -> SplitResult:
+    """Split a URL once; the validity, scope and exclusion checks all reuse the result."""
+    return urlsplit(url)
+
+@lru_cache(maxsize=None)
+def _compile_globs(patterns: Tuple[str, ...]) -> Optional[re.Pattern]:
+    """Combine glob patterns into one regex, shared by handlers with the same patterns."""
+    if not patterns:
+        return None
+    return re.compile('|'.join(fnmatch.translate(p) for p in patterns))
+
+ROBOTS_CACHE_TTL = 3600  # Seconds before a domain's robots.txt is fetched again
+
+@dataclass
+class RobotsEntry:
+    parser: RobotFileParser
+    cached_at: float
+
+class RobotsManager:
+    """Fetches robots.txt once per domain and shares the rules between URL handlers."""
+    
+    def __init__(self, ttl: float = ROBOTS_CACHE_TTL):
+        self.ttl = ttl
+        self.entries: Dict[str, RobotsEntry] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.logger = logging.getLogger(__name__)
+
+    def can_fetch(self, url: str, user_agent: str) -> bool:
+        """
+        Check the URL against its domain's cached robots.txt rules.
+        
+        Nothing is fetched here: the crawler loads a domain's rules through its
+        session before requesting its pages, and a domain whose rules have not
+        been loaded yet is allowed.
+        """
+        # Usually already split by the validity checks, so this is a cache hit
+        parsed = _cached_split(url)
+        origin = f"{parsed.scheme}://{parsed.netloc}"
+        if origin not in self.entries:
+            return True
+        path = f"{parsed.path}?{parsed.query}" if parsed.query else parsed.path
+        return _can_fetch_cached(self, origin, path, user_agent)
+
+    async def load(self, url: str, session: aiohttp.ClientSession) -> RobotFileParser:
+        """
+        Fetch robots.txt for the URL's domain through the session unless it is cached.
+        
+        A stale copy keeps being served while a fresh one is fetched in the background.
+        """
+        parsed = _cached_split(url)
+        origin = f"{parsed.scheme}://{parsed.netloc}"
+        entry = self.entries.get(origin)
+        if entry is not None and not self._is_stale(entry):
+            return entry.parser
+        # Handlers sharing a domain wait on the same fetch
+        task = self._pending.get(origin)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(origin, session))
+            self._pending[origin] = task
+            task.add_done_callback(lambda _: self._pending.pop(origin, None))
+        if entry is not None:
+            return entry.parser
+        return await task
+
+    async def _fetch(self, origin: str, session: aiohttp.ClientSession) -> RobotFileParser:
+        parser = RobotFileParser(f"{origin}/robots.txt")
+        try:
+            async with session.get(parser.url, timeout=aiohttp.ClientTimeout(total=5)) as response:
+                # Same status handling as RobotFileParser.read()
+                if response.status in (401, 403):
+                    parser.disallow_all = True
+                elif 400 <= response.status < 500:
+                    parser.allow_all = True
+                elif response.status < 400:
+                    text = await response.text(errors='replace')
+                    parser.parse(text.splitlines())
+        except Exception as e:
+            self.logger.warning(f"Could not fetch robots.txt: {str(e)}")
+        return self._store(origin, parser).parser
+
+    def _is_stale(self, entry: RobotsEntry) -> bool:
+        return time.monotonic() - entry.cached_at > self.ttl
+
+    def _store(self, origin: str, parser: RobotFileParser) -> RobotsEntry:
+        entry = RobotsEntry(parser, time.monotonic())
+        self.entries[origin] = entry
+        # Cached verdicts may have come from the rules being replaced
+        _can_fetch_cached.cache_clear()
+        return entry
+
+@lru_cache(maxsize=100_000)
+def _can_fetch_cached(manager: RobotsManager, origin: str, path: str, user_agent: str) -> bool:
+    return manager.entries[origin].parser.can_fetch(user_agent, origin + path)
+
+# Shared by every URLHandler so each domain's robots.txt is fetched once per process
+robots_manager = RobotsManager()
 
 class URLHandler:
     """Handles URL processing, validation, and robots.txt compliance."""
     
-    def __init__(self, base_url: str, respect_robots: bool = True, exclude_keywords: List[str] = None):
+    # Static files, non-HTTP links, auth pages and tracking URLs
+    _EXCLUDED_URL_PATTERNS = (
+        r'\.(?:jpg|jpeg|png|gif|ico|css|js|xml|json)$',
+        r'mailto:|tel:',
+        r'login|logout|signin|signout|admin',
+        r'[?&]utm_',
+    )
+    
+    # Fixed attribute layout; the memoized predicates are stored per instance
+    __slots__ = (
+        'base_url', 'base_domain', 'base_path_prefix', '_internal_prefixes', 'respect_robots',
+        'logger', 'same_path_only', 'exclude_keywords', 'exclusion_patterns',
+        '_excl_re', '_exclude_re', 'is_valid_url', 'is_internal_url',
+    )
+    
+    def __init__(self, base_url: str, respect_robots: bool = True, exclude_keywords: List[str] = None,
+                 exclusion_patterns: List[str] = None, same_path_only: bool = False):
         self.base_url = self._normalize_url(base_url)
         self.base_domain = urlparse(self.base_url).netloc
         self.base_path_prefix = urlparse(self.base_url).path
+        self._internal_prefixes = (f'http://{self.base_domain}', f'https://{self.base_domain}')
         self.respect_robots = respect_robots
-        self.robot_parser = RobotFileParser()
         self.logger = logging.getLogger(__name__)
-        self.same_path_only = False
+        self.same_path_only = same_path_only
         self.exclude_keywords = exclude_keywords or []
+        self.exclusion_patterns = exclusion_patterns or []
+        # Glob patterns and keywords are compiled once into a single regex each
+        self._excl_re = _compile_globs(tuple(self.exclusion_patterns))
+        patterns = list(self._EXCLUDED_URL_PATTERNS)
+        if self.exclude_keywords:
+            # Keywords only count when they appear in the path, not the host or query;
+            # the lookahead pins the end of the host so the match cannot start inside it
+            patterns.append(r'^[a-z][a-z0-9+.-]*://[^/?#]*(?=/)[^?#]*?(?:%s)'
+                            % '|'.join(map(re.escape, self.exclude_keywords)))
+        self._exclude_re = re.compile('|'.join(patterns), re.IGNORECASE)
         
-        if self.respect_robots:
-            self._setup_robots_txt()
+        # The predicates depend only on the URL and the settings above, which are
+        # fixed from here on, so each handler memoizes its own verdicts
+        self.is_valid_url = lru_cache(maxsize=1 << 16)(self._is_valid_url)
+        self.is_internal_url = lru_cache(maxsize=1 << 16)(self._is_internal_url)
 
-    def _setup_robots_txt(self):
-        """Initialize robots.txt parser."""
-        try:
-            robots_url = urljoin(self.base_url, '/robots.txt')
-            self.robot_parser.set_url(robots_url)
-            self.robot_parser.read()
-        except Exception as e:
-            self.logger.warning(f"Could not fetch robots.txt: {str(e)}")
+    async def load_robots(self, session: aiohttp.ClientSession, url: Optional[str] = None) -> None:
+        """Fetch robots.txt for the domain of the URL (default: the base URL) without blocking the event loop."""
+        if not self.respect_robots:
+            return
+        await robots_manager.load(url or self.base_url, session)
 
     def _normalize_url(self, url: str) -> str:
         """Normalize URL format."""
-        # Remove fragments
-        url = re.sub(r'#.*$', '', url)
-        # Remove trailing slash
-        url = re.sub(r'/$', '', url)
-        return url
+        # Remove fragments and a trailing slash
+        return url.partition('#')[0].removesuffix('/')
 
-    def is_internal_url(self, url: str) -> bool:
+    def _is_internal_url(self, url: str) -> bool:
         """Check if URL belongs to the same domain."""
-        try:
-            parsed_url = urlparse(url)
-            is_same_domain = parsed_url.netloc == self.base_domain or not parsed_url.netloc
-            
-            # If same_path_only is enabled, also check the path prefix
-            if self.same_path_only:
-                return is_same_domain and self.has_same_path_prefix(url)
+        if url.startswith(self._internal_prefixes):
+            # The domain must end here, so example.com.evil.com does not pass
+            tail = url[url.index('//') + 2 + len(self.base_domain):][:1]
+            is_same_domain = tail in ('', '/', '?', '#')
+        elif url.startswith(('http://', 'https://')):
+            is_same_domain = False
+        else:
+            # Relative and unusual URLs still go through a full parse
+            try:
+                netloc = _cached_split(url).netloc
+            except ValueError:
+                return False
+            is_same_domain = netloc == self.base_domain or not netloc
             
-            return is_same_domain
-        except Exception:
-            return False
+        # If same_path_only is enabled, also check the path prefix
+        if self.same_path_only:
+            return is_same_domain and self.has_same_path_prefix(url)
+        
+        return is_same_domain
 
     def has_same_path_prefix(self, url: str) -> bool:
         """Check if URL has the same path prefix as the base URL."""
         try:
-            parsed_url = urlparse(url)
-            url_path = parsed_url.path
+            url_path = _cached_split(url).path
             
             # If base path is empty or just '/', any path is valid
             if not self.base_path_prefix or self.base_path_prefix == '/':
@@ -74,23 +224,23 @@ class URLHandler:
         if not self.respect_robots:
             return True
         try:
-            return self.robot_parser.can_fetch(user_agent, url)
+            return robots_manager.can_fetch(url, user_agent)
         except Exception:
             return True
 
     def extract_links(self, html: str, current_url: str) -> List[str]:
         """Extract and normalize all links from HTML content."""
-        from bs4 import BeautifulSoup
-        
         links = set()
         try:
-            soup = BeautifulSoup(html, 'html.parser')
-            for anchor in soup.find_all('a', href=True):
-                href = anchor['href']
-                absolute_url = urljoin(current_url, href)
-                normalized_url = self._normalize_url(absolute_url)
+            # Navigation and footers repeat the same hrefs, so resolve each distinct one once
+            hrefs = _anchor_hrefs(html)
+            normalize_url, is_valid_url = self._normalize_url, self.is_valid_url
+            for href in hrefs:
+                # Absolute links need no joining against the page URL
+                absolute_url = href if href.startswith(('http://', 'https://')) else urljoin(current_url, href)
+                normalized_url = normalize_url(absolute_url)
                 
-                if self.is_valid_url(normalized_url):
+                if is_valid_url(normalized_url):
                     links.add(normalized_url)
                     
         except Exception as e:
@@ -98,10 +248,17 @@ class URLHandler:
             
         return list(links)
 
-    def is_valid_url(self, url: str) -> bool:
+    def filter_batch(self, urls: List[str]) -> List[str]:
+        """Return the valid internal URLs of a batch, in their original order."""
+        # Excluded URLs are dropped by C-level regex scans before the per-URL checks
+        candidates = filterfalse(self._exclude_re.search, urls)
+        is_valid_url, is_internal_url = self.is_valid_url, self.is_internal_url
+        return [url for url in candidates if is_valid_url(url) and is_internal_url(url)]
+
+    def _is_valid_url(self, url: str) -> bool:
         """Validate URL format and check against exclusion patterns."""
         try:
-            parsed = urlparse(url)
+            parsed = _cached_split(url)
             return all([
                 parsed.scheme in ('http', 'https'),
                 parsed.netloc,
@@ -112,29 +269,11 @@ class URLHandler:
 
     def _is_excluded_url(self, url: str) -> bool:
         """Check if URL matches common exclusion patterns or contains exclude keywords."""
-        excluded_patterns = [
-            r'\.(jpg|jpeg|png|gif|ico|css|js|xml|json)$',
-            r'(mailto:|tel:)',
-            r'(login|logout|signin|signout|admin)',
-            r'(\?|&)utm_',
-        ]
-        
-        # Check standard exclusion patterns
-        if any(re.search(pattern, url, re.IGNORECASE) for pattern in excluded_patterns):
+        if self._exclude_re.search(url):
             return True
             
-        # Check for exclude keywords in the URL path
-        if self.exclude_keywords:
-            parsed_url = urlparse(url)
-            path = parsed_url.path.lower()
-            
-            # Check if any exclude keyword is in the path
-            for keyword in self.exclude_keywords:
-                if keyword.lower() in path:
-                    self.logger.debug(f"Excluding URL due to keyword match: {url}")
-                    return True
-                
-        return False
+        # Check configured glob patterns against the whole URL
+        return bool(self._excl_re and self._excl_re.match(url))
 
     def normalize_links(self, links: List[str], base_url: str) -> List[str]:
         """Normalize a list of URLs relative to a base URL."""
@@ -1,48 +1,132 @@
 from urllib.parse import urljoin, urlparse
-from collections import deque
-from typing import Set, Optional
+from collections import defaultdict, deque
+from typing import DefaultDict, Deque, Dict, List, Set, Optional, Tuple
+import asyncio
+import heapq
+import time
+
+_INDEX_SUFFIXES = ('', '/', '/index.html', '/index.htm', '/index.php')
+
+def _bare_path(path: str) -> str:
+    """Strip a trailing index file name and slashes from a URL path."""
+    for suffix in _INDEX_SUFFIXES[2:]:
+        if path.endswith(suffix):
+            path = path[:-len(suffix)]
+            break
+    return path.rstrip('/')
+
+def _fold_url(url: str) -> str:
+    """
+    Return the key shared by every spelling _generate_url_permutations lists for a URL.
+    
+    The scheme, a leading `www.` and any trailing index file or slash are
+    dropped; unlike the permutations, the query string is kept.
+    """
+    parsed = urlparse(url)
+    key = parsed.netloc.removeprefix('www.') + _bare_path(parsed.path)
+    return f"{key}?{parsed.query}" if parsed.query else key
+
+def _generate_url_permutations(url: str) -> List[str]:
+    """
+    Return the http/https, www/bare, trailing-slash and index-file spellings of a URL.
+    
+    `/x`, `/x/` and `/x/index.html` yield the same set, so whichever arrives
+    first marks all the others.
+    """
+    parsed = urlparse(url)
+    host = parsed.netloc[4:] if parsed.netloc.startswith('www.') else parsed.netloc
+    # Reduce the path to its bare directory form before adding every suffix back
+    path = _bare_path(parsed.path)
+    return [f"{scheme}://{prefix}{host}{path}{suffix}"
+            for scheme in ('http', 'https') for prefix in ('', 'www.') for suffix in _INDEX_SUFFIXES]
 
 class URLManager:
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, politeness_delay: float = 0.0):
         self.base_url = base_url
         self.base_domain = urlparse(base_url).netloc
-        self.url_queue = deque([base_url])
         self.visited_urls: Set[str] = set()
+        # Per-host FIFO queues, plus a heap of (next allowed visit, host) holding
+        # every host whose queue is non-empty, so hosts take turns politely
+        self._by_host: DefaultDict[str, Deque[str]] = defaultdict(deque)
+        self._heap: List[Tuple[float, str]] = []
+        self._next_visit: Dict[str, float] = {}
+        self._politeness_delay = politeness_delay
+        self._push(base_url)
+        # Every spelling of every URL ever queued
+        self.enqueued: Set[str] = set()
+        self._mark_all(_generate_url_permutations(base_url))
         
     def is_internal_link(self, url: str) -> bool:
         """Check if URL belongs to the same domain."""
         try:
-            return urlparse(url).netloc == self.base_domain
+            netloc = urlparse(url).netloc
+            return netloc == self.base_domain or netloc.removeprefix('www.') == self.base_domain.removeprefix('www.')
         except:
             return False
             
     def normalize_url(self, url: str) -> str:
         """Normalize URL to absolute form without fragments."""
-        url = urljoin(self.base_url, url)
+        # Absolute links are parsed once; only relative ones need joining first
+        if not url.startswith(('http://', 'https://')):
+            url = urljoin(self.base_url, url)
         parsed = urlparse(url)
         return f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
         
     def add_url(self, url: str) -> None:
-        """Add URL to queue if it's internal and not visited."""
+        """Add URL to queue if it's internal and has not been queued before."""
         normalized_url = self.normalize_url(url)
-        if (self.is_internal_link(normalized_url) and 
-            normalized_url not in self.visited_urls and 
-            normalized_url not in self.url_queue):
-            self.url_queue.append(normalized_url)
+        if not self.is_internal_link(normalized_url):
+            return
+        if normalized_url in self.enqueued:
+            return
+        self._mark_all(_generate_url_permutations(normalized_url))
+        self._push(normalized_url)
+        
+    def add_urls(self, urls: List[str]) -> None:
+        """Add several URLs at once, keeping their order and skipping queued ones."""
+        candidates = dict.fromkeys(
+            url for url in map(self.normalize_url, urls) if self.is_internal_link(url)
+        )
+        # One set difference drops everything already queued
+        new_urls = candidates.keys() - self.enqueued
+        for url in candidates:
+            # A spelling of an earlier URL in this batch may have been marked meanwhile
+            if url in new_urls and url not in self.enqueued:
+                self._mark_all(_generate_url_permutations(url))
+                self._push(url)
+        
+    def _mark_all(self, urls: List[str]) -> None:
+        """Record URLs as queued so none of them is admitted again."""
+        self.enqueued.update(urls)
             
-    def get_next_url(self) -> Optional[str]:
-        """Get next URL from queue."""
-        try:
-            url = self.url_queue.popleft()
-            self.visited_urls.add(url)
-            return url
-        except IndexError:
+    def _push(self, url: str) -> None:
+        """Append URL to its host's queue, scheduling the host if it was idle."""
+        host = urlparse(url).netloc
+        queue = self._by_host[host]
+        if not queue:
+            heapq.heappush(self._heap, (self._next_visit.get(host, 0.0), host))
+        queue.append(url)
+            
+    async def get_next_url(self) -> Optional[str]:
+        """Get the next URL from the host that may be visited soonest, waiting out its delay."""
+        if not self._heap:
             return None
+        next_visit, host = heapq.heappop(self._heap)
+        wait = next_visit - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        queue = self._by_host[host]
+        url = queue.popleft()
+        self._next_visit[host] = time.monotonic() + self._politeness_delay
+        if queue:
+            heapq.heappush(self._heap, (self._next_visit[host], host))
+        self.visited_urls.add(url)
+        return url
             
     def has_urls(self) -> bool:
         """Check if there are URLs left to process."""
-        return len(self.url_queue) > 0
+        return bool(self._heap)
         
     def get_visited_count(self) -> int:
         """Get count of visited URLs."""
-        return len(self.visited_urls)
\ No newline at end of file
+        return len(self.visited_urls)
@@ -2,13 +2,20 @@ import pytest
 import asyncio
 import tempfile
 import os
+import json
+import dataclasses
+from contextlib import nullcontext
 from pathlib import Path
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 from src.config import CrawlerConfig
-from src.crawler import Crawler
+from src.crawler import Crawler, _canon
 from src.content_extractor import ContentExtractor
-from src.url_handler import URLHandler
+from src.url_handler import URLHandler, RobotsManager
+from src.url_manager import URLManager
 from src.site_mapper import SiteMapper
-from unittest.mock import AsyncMock, MagicMock, ANY
+from unittest.mock import AsyncMock, MagicMock, ANY, patch
 
 @pytest.fixture
 def config():
@@ -45,6 +52,30 @@ def test_url_handler_normalize_url(url_handler):
     for input_url, expected in test_urls:
         assert url_handler._normalize_url(input_url) == expected
 
+def test_canonical_url():
+    """Test that spelling variants of a URL share one canonical form."""
+    variants = [
+        'https://example.com/page?b=2&a=1',
+        'HTTPS://Example.COM:443/page?a=1&b=2',
+        'https://example.com/page?a=1&b=2#section',
+    ]
+    
+    assert {_canon(url) for url in variants} == {'https://example.com/page?a=1&b=2'}
+    assert _canon('http://example.com:8080/page') == 'http://example.com:8080/page'
+    # The site root with and without its trailing slash
+    assert _canon('http://example.com') == _canon('http://example.com/') == 'http://example.com/'
+
+def test_crawler_queues_each_page_once(config):
+    """Test that scheme, www and index-file spellings of a page are only queued once."""
+    crawler = Crawler(config)
+    for url in ['https://example.com/docs', 'http://www.example.com/docs/',
+                'https://example.com/docs/index.html', 'HTTPS://Example.com:443/docs/index.php',
+                'https://example.com/docs?page=2', 'https://example.com/', 'http://example.com/index.htm']:
+        crawler._enqueue(url, 0, url)
+    
+    queued = [crawler._queue.get_nowait()[0] for _ in range(crawler._queue.qsize())]
+    assert queued == ['https://example.com/docs', 'https://example.com/docs?page=2', 'https://example.com/']
+
 def test_url_handler_internal_url(url_handler):
     """Test internal URL detection."""
     internal_urls = [
@@ -97,6 +128,49 @@ def test_site_mapper_basic_functionality(site_mapper):
     assert site_mapper.get_page_depth(url) == 0
     assert len(site_mapper.site_map) == 1
 
+def test_site_mapper_save_output(site_mapper, tmp_path):
+    """Test that saved output round-trips, including non-ASCII page text."""
+    site_mapper.add_page('https://example.com', [], 0, {'title': 'Café', 'content': 'Crème "brûlée"\n\\'})
+    output = site_mapper.generate_output(['https://example.com'])
+    output_path = tmp_path / 'out' / 'result.json'
+    
+    site_mapper.save_output(output, output_path)
+    
+    saved = output_path.read_text(encoding='utf-8')
+    assert json.loads(saved) == output
+    assert 'Crème' in saved
+
+def test_site_mapper_skips_duplicate_content():
+    """Test that exact and near-duplicate page text is stored only once."""
+    site_mapper = SiteMapper(deduplicate=True)
+    text = ' '.join(f'word{i}' for i in range(200))
+    site_mapper.add_page('https://example.com/a', [], 0, {'title': 'A', 'content': text})
+    site_mapper.add_page('https://example.com/a?print=1', [], 1, {'title': 'A', 'content': text})
+    site_mapper.add_page('https://example.com/a?page=1', [], 1, {'title': 'A', 'content': text + ' page 1'})
+    site_mapper.add_page('https://example.com/b', [], 1, {'title': 'B', 'content': 'Something else entirely'})
+    
+    assert len(site_mapper.site_map) == 4
+    assert [page['url'] for page in site_mapper.concatenated_text] == [
+        'https://example.com/a',
+        'https://example.com/b',
+    ]
+
+def test_site_mapper_streams_pages(tmp_path):
+    """Test that streamed pages are written as NDJSON instead of kept in memory."""
+    stream_path = tmp_path / 'result.ndjson'
+    site_mapper = SiteMapper(stream_path)
+    site_mapper.add_page('https://example.com', ['https://example.com/a'], 0, {'title': 'Home', 'content': 'Hello'})
+    site_mapper.add_page('https://example.com/a', [], 1, {'title': 'A', 'content': 'World'})
+    
+    output = site_mapper.generate_output(['https://example.com'])
+    
+    pages = [json.loads(line) for line in stream_path.read_text(encoding='utf-8').splitlines()]
+    assert [page['content'] for page in pages] == ['Hello', 'World']
+    assert pages[0]['links'] == ['https://example.com/a']
+    assert output['metadata']['pages_file'] == str(stream_path)
+    assert output['llmfulltext'] == ''
+    assert len(output['site_map']) == 2
+
 @pytest.mark.asyncio
 async def test_crawler_initialization(config):
     """Test crawler initialization."""
@@ -138,6 +212,39 @@ def test_content_extractor_code_preservation(content_extractor):
     assert 'def example():' in result['content']
     assert len(result['code_blocks']) > 0
 
+def test_content_extractor_skips_code_in_comments_and_scripts(content_extractor):
+    """Test that <pre>/<code> inside comments and scripts is not taken for a code block."""
+    html = """
+    <html>
+        <head><script>document.write('<pre>not code</pre>');</script></head>
+        <body>
+            <!-- <code>commented out</code> -->
+            <pre class="python">print("real")</pre>
+        </body>
+    </html>
+    """
+    
+    result = content_extractor.extract_content(html, 'https://example.com')
+    assert result['code_blocks'] == [{'content': 'print("real")', 'language': 'python'}]
+    assert 'not code' not in result['content']
+    assert 'commented out' not in result['content']
+
+@pytest.mark.parametrize("lexbor", [True, False])
+def test_content_extractor_drops_page_chrome(content_extractor, lexbor):
+    """Test that both parser backends drop navigation chrome and keep body text."""
+    html = (
+        '<html><head><title>T</title><script>var x = 1;</script></head><body>'
+        '<nav><ul><li>Home</li><li>About</li></ul></nav>'
+        '<header><div>Site header</div></header>'
+        '<div><p>Body text</p></div><ul><li>Item</li></ul>'
+        '<footer><p>Copyright</p></footer>'
+        '</body></html>'
+    )
+    
+    with patch('src.content_extractor.LexborHTMLParser', None) if not lexbor else nullcontext():
+        result = content_extractor.extract_content(html, 'https://example.com')
+    assert result['content'] == 'TBody textItem'
+
 def test_url_handler_exclusion_patterns(url_handler):
     """Test URL exclusion patterns."""
     excluded_urls = [
@@ -151,6 +258,134 @@ def test_url_handler_exclusion_patterns(url_handler):
     for url in excluded_urls:
         assert url_handler.is_valid_url(url) is False
 
+def test_url_handler_config_exclusion_patterns():
+    """Test configured glob patterns and keywords."""
+    handler = URLHandler('https://example.com', respect_robots=False,
+                         exclude_keywords=['Draft'], exclusion_patterns=['*/ads/*', '*/tracking/*'])
+    
+    assert handler.is_valid_url('https://example.com/ads/page') is False
+    assert handler.is_valid_url('https://example.com/a/tracking/b') is False
+    assert handler.is_valid_url('https://example.com/drafts/post') is False
+    assert handler.is_valid_url('https://example.com/blog/post?ref=draft') is True
+    assert handler.is_valid_url('https://example.com/adsense') is True
+
+def test_url_handler_keywords_ignore_host():
+    """Test that exclude keywords in the hostname do not exclude the URL."""
+    handler = URLHandler('https://blog.example.com/', respect_robots=False, exclude_keywords=['blog', 'news'])
+    
+    assert handler.is_valid_url('https://blog.example.com/') is True
+    assert handler.is_valid_url('https://blog.example.com/page') is True
+    assert handler.is_valid_url('https://newsite.com/a') is True
+    assert handler.is_valid_url('https://blog.example.com/blog/post') is False
+    assert handler.is_valid_url('https://example.com/latest-news') is False
+
+@pytest.mark.parametrize("lexbor", [True, False])
+def test_url_handler_extract_links(url_handler, lexbor):
+    """Test that both parser backends resolve each anchor's href against the page URL."""
+    html = (
+        '<nav><a href="/page1">One</a><a href="/page1">One again</a></nav>'
+        '<p><a href="page2?x=1">Two</a><a name="top">No href</a>'
+        '<a href="mailto:me@example.com">Mail</a></p>'
+    )
+    
+    with patch('src.url_handler.LexborHTMLParser', None) if not lexbor else nullcontext():
+        links = url_handler.extract_links(html, 'https://example.com/docs/')
+    assert sorted(links) == ['https://example.com/docs/page2?x=1', 'https://example.com/page1']
+
+def test_url_handler_filter_batch(url_handler):
+    """Test that batch filtering keeps valid internal URLs in order."""
+    urls = [
+        'https://example.com/b',
+        'https://other.com/page',
+        'https://example.com/logo.png',
+        'https://example.com.evil.com/',
+        'https://example.com/a',
+        'mailto:test@example.com',
+    ]
+    
+    assert url_handler.filter_batch(urls) == ['https://example.com/b', 'https://example.com/a']
+
+@pytest.mark.asyncio
+async def test_robots_manager_never_blocks_on_fetches():
+    """Test that unknown domains are allowed and stale rules are refreshed in the background."""
+    rules = ["User-agent: *\nDisallow: /old\n"]
+    
+    async def robots(request):
+        return web.Response(text=rules[0])
+    
+    app = web.Application()
+    app.router.add_get('/robots.txt', robots)
+    async with TestServer(app) as server, aiohttp.ClientSession() as session:
+        manager = RobotsManager()
+        url = str(server.make_url('/old'))
+        origin = str(server.make_url('')).rstrip('/')
+        
+        # Nothing is fetched synchronously for a domain that was never loaded
+        assert manager.can_fetch(url, '*') is True
+        assert origin not in manager.entries
+        
+        await manager.load(url, session)
+        assert manager.can_fetch(url, '*') is False
+        
+        # A stale entry is served immediately while the new rules are fetched
+        rules[0] = "User-agent: *\nDisallow: /new\n"
+        manager.entries[origin].cached_at -= 2 * manager.ttl
+        await manager.load(url, session)
+        assert manager.can_fetch(url, '*') is False
+        
+        await asyncio.gather(*manager._pending.values())
+        assert manager.can_fetch(url, '*') is True
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("body, content_type, expected", [
+    # Bodies past max_page_bytes are cut off there
+    (b'a' * 5000, 'text/html', 'a' * 1000),
+    # The declared charset is used to decode the body
+    ('café'.encode('iso-8859-1'), 'text/html; charset=iso-8859-1', 'café'),
+    # An unknown charset falls back to UTF-8
+    ('café'.encode('utf-8'), 'text/html; charset=x-unknown', 'café'),
+])
+async def test_read_html(config, body, content_type, expected):
+    """Test that page bodies are capped at max_page_bytes and decoded with their declared charset."""
+    async def page(request):
+        return web.Response(body=body, headers={'Content-Type': content_type})
+    
+    app = web.Application()
+    app.router.add_get('/', page)
+    crawler = Crawler(dataclasses.replace(config, max_page_bytes=1000))
+    async with TestServer(app) as server, aiohttp.ClientSession() as session:
+        url = str(server.make_url('/'))
+        async with session.get(url) as response:
+            assert await crawler._read_html(response, url) == expected
+
+@pytest.mark.asyncio
+async def test_url_manager_rejects_url_permutations():
+    """Test that scheme, www and index-file spellings of a queued URL are not queued again."""
+    manager = URLManager('https://example.com/start')
+    manager.add_url('http://example.com')
+    manager.add_url('https://www.example.com/index.html')
+    manager.add_url('https://example.com/')
+    manager.add_url('http://www.example.com/start')
+    manager.add_url('https://example.com/docs/index.php')
+    manager.add_url('https://www.example.com/docs/')
+    # Trailing-slash spellings are rejected whichever one arrives first
+    manager.add_url('https://example.com/guide')
+    manager.add_url('https://example.com/guide/')
+    manager.add_url('https://example.com/api/')
+    manager.add_url('https://example.com/api')
+    
+    queued = []
+    while manager.has_urls():
+        queued.append(await manager.get_next_url())
+    
+    assert queued == [
+        'https://example.com/start',
+        'http://example.com',
+        'https://example.com/docs/index.php',
+        'https://example.com/guide',
+        'https://example.com/api/',
+    ]
+
 @pytest.mark.asyncio
 async def test_multiple_urls_crawling():
     """Test that the crawler can handle multiple starting URLs."""
@@ -176,8 +411,11 @@ async def test_multiple_urls_crawling():
     # Test URLs
     urls = ["https://example.com", "https://example.org"]
     
-    # Call the crawl method with multiple URLs
-    result = await crawler.crawl(urls)
+    # Call the crawl method with multiple URLs, closing the session it opens
+    try:
+        result = await crawler.crawl(urls)
+    finally:
+        await crawler.aclose()
     
     # Verify that _crawl_url was called for each URL with the correct parameters
     assert crawler._crawl_url.call_count == 2
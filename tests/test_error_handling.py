@@ -1,29 +1,80 @@
 import pytest
 import asyncio
+import dataclasses
+import time
+from email.utils import formatdate
+from collections import defaultdict
 from unittest.mock import patch, MagicMock, AsyncMock
 from pathlib import Path
 import aiohttp
-from datetime import datetime, timedelta
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 
 from src.config import CrawlerConfig
-from src.crawler import Crawler, CircuitBreaker
+from src.crawler import Crawler, CircuitBreaker, _parse_retry_after
 
-@pytest.fixture
+OUTPUT_PATH = Path("test_output.json")
+
+@pytest.fixture(scope="module")
 def config():
-    """Create a test configuration."""
+    """Create a test configuration, shared by the module's tests since it is immutable."""
     return CrawlerConfig(
         max_depth=2,
         max_links=10,
         delay=0.01,  # Small delay for faster tests
         timeout=1,
-        output_path=Path("test_output.json"),
+        output_path=OUTPUT_PATH,
         exclusion_patterns=["*/ads/*"],
         max_retries=2,
         retry_delay=0.01,  # Small delay for faster tests
-        circuit_breaker_threshold=2,
+        circuit_breaker_threshold=3,
         circuit_breaker_timeout=1
     )
 
+@pytest.fixture
+def crawler_with_handler(config):
+    """Create a crawler whose start URLs all share one permissive URL handler."""
+    crawler = Crawler(config)
+    url_handler = MagicMock()
+    url_handler.is_valid_url.return_value = True
+    url_handler.can_fetch.return_value = True
+    url_handler.load_robots = AsyncMock()
+    url_handler.filter_batch.side_effect = lambda links: links
+    url_handler.extract_links.return_value = []
+    crawler.url_handlers = defaultdict(lambda: url_handler)
+    return crawler
+
+def serve(responses) -> TestServer:
+    """
+    Local HTTP server answering successive requests from a script; the last entry repeats.
+    
+    An int is answered with that status, a (status, headers) pair with those headers
+    added and "truncated" with a body cut off mid-transfer.
+    The paths of the requests received are collected in `server.requested`.
+    """
+    responses = list(responses)
+    requested = []
+    
+    async def handler(request):
+        requested.append(request.path)
+        response = responses.pop(0) if len(responses) > 1 else responses[0]
+        if response == "truncated":
+            # Promise more bytes than are sent, so reading the body fails with a client error
+            truncated = web.StreamResponse(headers={"Content-Type": "text/html", "Content-Length": "1000"})
+            await truncated.prepare(request)
+            await truncated.write(b"<html>")
+            request.transport.close()
+            return truncated
+        status, headers = response if isinstance(response, tuple) else (response, None)
+        return web.Response(status=status, headers=headers, text="<html><body>Test</body></html>",
+                            content_type="text/html")
+    
+    app = web.Application()
+    app.router.add_get("/{path:.*}", handler)
+    server = TestServer(app)
+    server.requested = requested
+    return server
+
 class TestCircuitBreaker:
     """Test the CircuitBreaker class."""
     
@@ -34,12 +85,12 @@ class TestCircuitBreaker:
         # First failure shouldn't open the circuit
         cb.record_failure("example.com")
         assert not cb.is_open("example.com")
-        assert cb.failures["example.com"] == 1
+        assert len(cb.state["example.com"].failures) == 1
         
         # Second failure should open the circuit
         cb.record_failure("example.com")
         assert cb.is_open("example.com")
-        assert cb.failures["example.com"] == 2
+        assert len(cb.state["example.com"].failures) == 2
         
         # Different domain should be unaffected
         assert not cb.is_open("other.com")
@@ -50,14 +101,48 @@ class TestCircuitBreaker:
         
         # Record a failure
         cb.record_failure("example.com")
-        assert cb.failures["example.com"] == 1
+        assert len(cb.state["example.com"].failures) == 1
         
         # Record a success
         cb.record_success("example.com")
-        assert cb.failures["example.com"] == 0
+        assert len(cb.state["example.com"].failures) == 0
+    
+    def test_failures_outside_window(self):
+        """Test that failures older than the window do not open the circuit."""
+        cb = CircuitBreaker(threshold=2, timeout=60, window_seconds=10)
+        
+        cb.record_failure("example.com")
+        # Age the first failure past the window
+        cb.state["example.com"].failures[0] -= 20
+        cb.record_failure("example.com")
+        assert not cb.is_open("example.com")
+        
+        # A third failure inside the window pairs with the second one
+        cb.record_failure("example.com")
+        assert cb.is_open("example.com")
+    
+    def test_retry_after_opens_circuit(self):
+        """Test a Retry-After delay keeps the circuit open for that long."""
+        cb = CircuitBreaker(threshold=5, timeout=60)
+        
+        cb.record_failure("example.com", retry_after=120)
+        assert cb.is_open("example.com")
+        assert cb.next_probe_at("example.com") > time.monotonic() + 110
+        assert cb.next_probe_at("other.com") is None
+    
+    def test_parse_retry_after(self):
+        """Test Retry-After values in delta-seconds and HTTP-date form."""
+        assert _parse_retry_after("120") == 120
+        assert _parse_retry_after(" 5 ") == 5
+        in_a_minute = formatdate(time.time() + 60, usegmt=True)
+        assert 50 < _parse_retry_after(in_a_minute) <= 60
+        assert _parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+        assert _parse_retry_after(None) is None
+        assert _parse_retry_after("soon") is None
+        assert _parse_retry_after("-5") is None
     
     def test_circuit_timeout(self):
-        """Test circuit closes after timeout."""
+        """Test circuit turns half-open after timeout and closes on a successful probe."""
         cb = CircuitBreaker(threshold=1, timeout=1)
         
         # Open the circuit
@@ -65,138 +150,191 @@ class TestCircuitBreaker:
         assert cb.is_open("example.com")
         
         # Set the timeout to have expired
-        cb.open_circuits["example.com"] = datetime.now() - timedelta(seconds=2)
+        cb.state["example.com"].open_until = time.monotonic() - 2
+        
+        # Circuit should be half-open now, letting a single probe through
+        assert not cb.is_open("example.com")
+        assert cb.state["example.com"].open_until is None
+        assert cb.state["example.com"].probes == 1
+        assert len(cb.state["example.com"].failures) == 0
+        assert cb.acquire("example.com")
+        assert not cb.acquire("example.com")
         
-        # Circuit should be closed now
+        # A successful probe closes the circuit
+        cb.record_success("example.com")
+        assert cb.state["example.com"].probes is None
         assert not cb.is_open("example.com")
-        assert "example.com" not in cb.open_circuits
-        assert cb.failures["example.com"] == 0
+    
+    def test_failed_probe_reopens_circuit(self):
+        """Test a failed probe reopens the circuit with a doubled timeout."""
+        cb = CircuitBreaker(threshold=1, timeout=10)
+        
+        cb.record_failure("example.com")
+        cb.state["example.com"].open_until = time.monotonic() - 1
+        assert cb.acquire("example.com")
+        
+        cb.record_failure("example.com")
+        assert cb.is_open("example.com")
+        assert cb.state["example.com"].probes is None
+        assert cb.state["example.com"].timeout == 20
+        assert cb.state["example.com"].open_until > time.monotonic() + 15
 
 @pytest.mark.asyncio
 class TestCrawlerErrorHandling:
     """Test the crawler's error handling capabilities."""
     
-    async def test_retry_mechanism(self, config):
-        """Test that the crawler retries failed requests."""
-        crawler = Crawler(config)
-        # Initialize URL handlers
-        test_url = "https://example.com"
-        url_handler = MagicMock()
-        url_handler.is_valid_url.return_value = True
-        url_handler.can_fetch.return_value = True
-        url_handler.is_internal_url.return_value = True
-        url_handler.extract_links.return_value = []
-        crawler.url_handlers = {test_url: url_handler}
-        
-        # Mock session with a side effect that fails twice then succeeds
-        mock_response = AsyncMock()
-        mock_response.status = 200
-        mock_response.text = AsyncMock(return_value="<html><body>Test</body></html>")
-        mock_response.headers = {'Content-Type': 'text/html'}
-        
-        mock_session = MagicMock()
-        mock_context_manager = AsyncMock()
-        mock_context_manager.__aenter__.side_effect = [
-            aiohttp.ClientError("Test error"),  # First attempt fails
-            aiohttp.ClientError("Test error"),  # Second attempt fails
-            mock_response  # Third attempt succeeds
-        ]
-        mock_session.get.return_value = mock_context_manager
-        
-        # Call the method
-        await crawler._crawl_url(mock_session, test_url, 0, test_url)
-        
-        # Verify the crawler made 3 attempts (initial + 2 retries)
-        assert mock_session.get.call_count == 3
-        assert test_url not in crawler.failed_urls
-        assert test_url in crawler.visited_urls
-    
-    async def test_circuit_breaker(self, config):
-        """Test that the circuit breaker prevents requests to failing domains."""
-        crawler = Crawler(config)
-        
-        # Initialize URL handlers
-        url1 = "https://example.com/page1"
-        url2 = "https://example.com/page2"
-        url_handler = MagicMock()
-        url_handler.is_valid_url.return_value = True
-        url_handler.can_fetch.return_value = True
-        url_handler.is_internal_url.return_value = True
-        url_handler.extract_links.return_value = []
-        crawler.url_handlers = {url1: url_handler, url2: url_handler}
-        
-        # Mock session that always fails with server error
-        mock_error_response = AsyncMock()
-        mock_error_response.status = 500
-        mock_error_response.headers = {'Content-Type': 'text/html'}
-        
-        mock_session = MagicMock()
-        mock_context_manager = AsyncMock()
-        mock_context_manager.__aenter__.return_value = mock_error_response
-        mock_session.get.return_value = mock_context_manager
-        
-        # First URL should be attempted and fail after retries
-        await crawler._crawl_url(mock_session, url1, 0, url1)
-        
-        # Circuit breaker should be open now
-        assert crawler.circuit_breaker.is_open("example.com")
+    @pytest.mark.parametrize("responses, attempts, failed, errors", [
+        # Retried after two failed transfers, then succeeds
+        (["truncated", "truncated", 200], 3, False, {"ClientPayloadError": 2}),
+        # Server errors are retried until max_retries runs out
+        ([500], 3, True, {"HTTP 500": 3}),
+        # Client errors are not retried
+        ([404], 1, True, {"HTTP 404": 1}),
+    ])
+    async def test_response_handling(self, crawler_with_handler, responses, attempts, failed, errors):
+        """Test that the crawler retries and categorizes failed requests."""
+        crawler = crawler_with_handler
+        async with serve(responses) as server, aiohttp.ClientSession() as session:
+            test_url = str(server.make_url("/"))
+            await crawler._crawl_url(session, test_url, 0, test_url)
         
-        # Reset the mock to verify second URL is skipped
-        mock_session.get.reset_mock()
-        
-        # Second URL should be skipped without attempts due to open circuit breaker
-        await crawler._crawl_url(mock_session, url2, 0, url2)
+        assert len(server.requested) == attempts
+        assert (test_url in crawler.failed_urls) is failed
+        assert (test_url in crawler.visited_urls) is not failed
+        assert crawler.error_counts == errors
+    
+    async def test_circuit_breaker(self, crawler_with_handler):
+        """Test that the circuit breaker prevents requests to failing domains."""
+        crawler = crawler_with_handler
+        async with serve([500]) as server, aiohttp.ClientSession() as session:
+            url1 = str(server.make_url("/page1"))
+            url2 = str(server.make_url("/page2"))
+            domain = f"{server.host}:{server.port}"
+            
+            # First URL should be attempted and fail after retries
+            await crawler._crawl_url(session, url1, 0, url1)
+            
+            # Circuit breaker should be open now
+            assert crawler.circuit_breaker.is_open(domain)
+            
+            # Second URL should be skipped without attempts due to open circuit breaker
+            await crawler._crawl_url(session, url2, 0, url2)
         
-        # Verify the second URL was skipped
-        assert mock_session.get.call_count == 0  # No attempts for the second URL
+        # Verify the second URL was held back rather than requested or dropped
+        assert server.requested.count("/page1") == 3
+        assert "/page2" not in server.requested  # No attempts for the second URL
         assert url1 in crawler.failed_urls
-        assert url2 not in crawler.failed_urls  # Not even marked as failed, just skipped
+        assert url2 not in crawler.failed_urls
+        assert [item[0] for item in crawler._held[domain]] == [url2]
+        for timer in crawler._hold_timers:
+            timer.cancel()
     
-    async def test_error_categorization(self, config):
-        """Test that the crawler correctly categorizes different types of errors."""
-        crawler = Crawler(config)
-        
-        # Initialize URL handlers
-        url1 = "https://example.com/not-found"  # Will return 404
-        url2 = "https://example.com/server-error"  # Will return 500
+    async def test_failed_probe_stops_retries(self, crawler_with_handler):
+        """Test that a failed half-open probe is not followed by retries."""
+        crawler = crawler_with_handler
+        async with serve([500]) as server, aiohttp.ClientSession() as session:
+            url = str(server.make_url("/page"))
+            domain = f"{server.host}:{server.port}"
+            
+            # Open the circuit and let its timeout expire, so the next request is a probe
+            for _ in range(crawler.circuit_breaker.threshold):
+                crawler.circuit_breaker.record_failure(domain)
+            crawler.circuit_breaker.state[domain].open_until = time.monotonic() - 1
+            
+            await crawler._crawl_url(session, url, 0, url)
         
-        url_handler = MagicMock()
-        url_handler.is_valid_url.return_value = True
-        url_handler.can_fetch.return_value = True
-        url_handler.is_internal_url.return_value = True
-        url_handler.extract_links.return_value = []
+        assert server.requested == ["/page"]
+        assert crawler.circuit_breaker.is_open(domain)
+        assert url in crawler.failed_urls
+    
+    async def test_short_retry_after_delays_retry(self, crawler_with_handler):
+        """Test that a 503 with a short Retry-After is retried once the server's wait is over."""
+        crawler = crawler_with_handler
+        async with serve([(503, {"Retry-After": "1"}), 200]) as server, aiohttp.ClientSession() as session:
+            url = str(server.make_url("/page"))
+            domain = f"{server.host}:{server.port}"
+            start = time.monotonic()
+            await crawler._crawl_url(session, url, 0, url)
         
-        crawler.url_handlers = {url1: url_handler, url2: url_handler}
+        assert server.requested == ["/page", "/page"]
+        assert time.monotonic() - start >= 1
+        assert not crawler.circuit_breaker.is_open(domain)
+        assert url in crawler.visited_urls
+    
+    async def test_retry_after_is_honoured(self, crawler_with_handler):
+        """Test that a 503 with a Retry-After beyond max_retry_delay is not retried while the server asked us to wait."""
+        crawler = crawler_with_handler
+        async with serve([(503, {"Retry-After": "120"})]) as server, aiohttp.ClientSession() as session:
+            url = str(server.make_url("/page"))
+            domain = f"{server.host}:{server.port}"
+            await crawler._crawl_url(session, url, 0, url)
         
-        # Mock responses
-        mock_404_response = AsyncMock()
-        mock_404_response.status = 404
-        mock_404_response.headers = {'Content-Type': 'text/html'}
+        assert server.requested == ["/page"]
+        # Held open for the Retry-After delay, capped at max_timeout
+        assert crawler.circuit_breaker.next_probe_at(domain) > time.monotonic() + crawler.circuit_breaker.max_timeout - 2
+        assert url in crawler.failed_urls
+    
+    @pytest.mark.parametrize("max_retry_delay, failed", [
+        # The retry waits out the Retry-After
+        (30.0, []),
+        # The circuit opens for the Retry-After, the other pages wait for it to close
+        (0.5, ["/p1"]),
+    ])
+    async def test_crawl_keeps_pages_of_open_circuit(self, config, max_retry_delay, failed):
+        """Test that a Retry-After does not lose the pages requested while the server asked us to wait."""
+        pages = [f"/p{i}" for i in range(6)]
+        throttled = []
         
-        mock_500_response = AsyncMock()
-        mock_500_response.status = 500
-        mock_500_response.headers = {'Content-Type': 'text/html'}
+        async def page(request):
+            if request.path == "/p1" and not throttled:
+                throttled.append(request.path)
+                return web.Response(status=503, headers={"Retry-After": "1"})
+            links = "".join(f'<a href="{path}">{path}</a>' for path in pages)
+            return web.Response(text=f"<html><body><p>{request.path}</p>{links}</body></html>",
+                                content_type="text/html")
         
-        # Configure the mock session's get method
-        def mock_get(url, **kwargs):
-            mock_context = AsyncMock()
-            if url == url1:
-                mock_context.__aenter__.return_value = mock_404_response
-            elif url == url2:
-                mock_context.__aenter__.return_value = mock_500_response
-            return mock_context
+        app = web.Application()
+        app.router.add_get("/{path:.*}", page)
+        config = dataclasses.replace(config, max_links=20, respect_robots_txt=False,
+                                     max_retry_delay=max_retry_delay)
+        crawler = Crawler(config)
+        async with TestServer(app) as server:
+            base = str(server.make_url(""))
+            try:
+                await crawler.crawl([base + "/"])
+            finally:
+                await crawler.aclose()
         
-        mock_session = MagicMock()
-        mock_session.get.side_effect = mock_get
+        assert sorted(url[len(base):] for url in crawler.failed_urls) == failed
+        assert len(crawler.visited_urls) == 1 + len(pages) - len(failed)
+    
+    async def test_crawl_keeps_pages_while_probing(self, config):
+        """Test that pages requested while a half-open circuit's probe is in flight are crawled after it."""
+        pages = [f"/p{i}" for i in range(6)]
         
-        # Process each URL
-        await crawler._crawl_url(mock_session, url1, 0, url1)
-        await crawler._crawl_url(mock_session, url2, 0, url2)
+        async def page(request):
+            # Slow enough for the probe to still be in flight when its links are dequeued
+            await asyncio.sleep(0.1)
+            links = "".join(f'<a href="{path}">{path}</a>' for path in pages)
+            return web.Response(text=f"<html><body><p>{request.path}</p>{links}</body></html>",
+                                content_type="text/html")
         
-        # Verify error categorization
-        assert crawler.error_counts["HTTP 404"] == 1
-        assert crawler.error_counts["HTTP 500"] > 0  # Could be multiple due to retries
+        app = web.Application()
+        app.router.add_get("/{path:.*}", page)
+        crawler = Crawler(dataclasses.replace(config, max_links=20, respect_robots_txt=False))
+        async with TestServer(app) as server:
+            base = str(server.make_url(""))
+            domain = f"{server.host}:{server.port}"
+            # Open the circuit and let its timeout expire, so the first request is a probe
+            for _ in range(crawler.circuit_breaker.threshold):
+                crawler.circuit_breaker.record_failure(domain)
+            crawler.circuit_breaker.state[domain].open_until = time.monotonic() - 1
+            crawler._enqueue(base + "/p0", 1, base + "/")
+            try:
+                await crawler.crawl([base + "/"])
+            finally:
+                await crawler.aclose()
         
-        # Verify URLs are marked as failed
-        assert url1 in crawler.failed_urls
-        assert url2 in crawler.failed_urls 
\ No newline at end of file
+        assert not crawler.failed_urls
+        assert len(crawler.visited_urls) == 1 + len(pages)
+